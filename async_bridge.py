@@ -0,0 +1,300 @@
+#coding=utf-8
+"""asyncio原生的llama流式对话接口
+
+ssh.send_message_and_get_response 是阻塞的生成器，每个进行中的请求都要占用一个线程。
+这里把paramiko通道的可读事件(channel.fileno())注册到事件循环(loop.add_reader)，
+一个事件循环线程即可同时服务多路对话，适合放在异步Web前端后面:
+
+    bridge = await AsyncLlamaBridge.connect(pool_size=2)
+    async for chunk in bridge.stream("你好"):
+        print(chunk, end="")
+    await bridge.close()
+
+会话租用、未读完回复的丢弃和损坏会话的重建都在事件循环中完成，只有SSH握手和重建会话
+这类一次性的阻塞操作放到线程池执行。回复时长、输出间隔和字符数的限制以及CancelToken
+与 LlamaSession.send_message_and_get_response 相同: 超限或取消时发送Ctrl-C并读到提示符为止。
+"""
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, AsyncIterator, Dict, Optional
+
+from llama_stream import LlamaStreamParser
+from ssh import (
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_MAX_OUTPUT_CHARS,
+    DEFAULT_RESPONSE_DEADLINE,
+    RECV_BUFFER_SIZE,
+    RESYNC_TIMEOUT,
+    CancelToken,
+    LlamaSession,
+    create_session_pool,
+)
+
+
+class AsyncLlamaBridge:
+    """接管一个 LlamaSessionPool 中的会话，用协程租用会话并流式读取回复"""
+
+    def __init__(self, pool, ssh_client=None, lease_timeout: float = 120.0):
+        self.pool = pool
+        self.ssh_client = ssh_client
+        self.lease_timeout = lease_timeout
+        self.idle: "asyncio.Queue[LlamaSession]" = asyncio.Queue()
+        # 会话由事件循环调度，不再经过会话池的线程队列
+        while not pool.idle.empty():
+            self.idle.put_nowait(pool.idle.get_nowait())
+        self.in_use = 0
+        self.waiting = 0
+        self.leases = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    async def connect(cls, pool_size: Optional[int] = None, lease_timeout: float = 120.0,
+                      **ssh_kwargs) -> "AsyncLlamaBridge":
+        """连接服务器并启动会话池(一次性的阻塞操作在线程池中执行)"""
+        loop = asyncio.get_running_loop()
+        client, pool = await loop.run_in_executor(
+            None, lambda: create_session_pool(pool_size, **ssh_kwargs)
+        )
+        return cls(pool, client, lease_timeout)
+
+    async def _wait_readable(self, session: LlamaSession, timeout: Optional[float]) -> bool:
+        """等待通道可读(有数据或已关闭)，超时返回False"""
+        channel = session.channel
+        if channel.recv_ready() or channel.closed or channel.eof_received:
+            return True
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = channel.fileno()
+
+        def _on_readable():
+            if not readable.done():
+                readable.set_result(True)
+
+        loop.add_reader(fd, _on_readable)
+        try:
+            await asyncio.wait_for(readable, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def _read(self, session: LlamaSession, timeout: Optional[float] = None) -> Optional[bytes]:
+        """读取已到达的原始字节，超时返回b""，通道关闭或出错返回None"""
+        try:
+            if not await self._wait_readable(session, timeout):
+                return b""
+            data = session.channel.recv(RECV_BUFFER_SIZE)
+        except Exception as e:
+            print(f"[{session.name}] 读取输出时出错: {e}", file=sys.stderr)
+            data = b""
+        if not data:
+            session.broken = True
+            return None
+        return data
+
+    async def _lease(self, timeout: Optional[float]) -> LlamaSession:
+        timeout = self.lease_timeout if timeout is None else timeout
+        requested_at = time.time()
+        self.waiting += 1
+        try:
+            session = await asyncio.wait_for(self.idle.get(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"等待空闲的llama会话超时({timeout}秒)")
+        finally:
+            self.waiting -= 1
+        wait = time.time() - requested_at
+        self.in_use += 1
+        self.leases += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return session
+
+    def _release(self, session: LlamaSession, synced: bool):
+        self.in_use -= 1
+        if synced and not session.broken:
+            self.idle.put_nowait(session)
+        else:
+            # 调用方提前退出(或任务被取消)时先中断远端生成，再在后台丢弃剩余输出；通道损坏则重建
+            if not session.broken:
+                session.interrupt()
+            asyncio.ensure_future(self._recover(session))
+
+    async def _drain(self, session: LlamaSession, timeout: float = 30.0) -> bool:
+        parser = LlamaStreamParser(skip_echo=False)
+        deadline = time.time() + timeout
+        while not parser.done:
+            remaining = deadline - time.time()
+            data = await self._read(session, remaining) if remaining > 0 else b""
+            if data is None or remaining <= 0:
+                session.broken = True
+                return False
+            parser.feed(data)
+        return True
+
+    async def _recover(self, session: LlamaSession):
+        if not session.broken and await self._drain(session):
+            self.idle.put_nowait(session)
+            return
+        session.close()
+        if session in self.pool.sessions:
+            self.pool.sessions.remove(session)
+        loop = asyncio.get_running_loop()
+        try:
+            replacement = await loop.run_in_executor(
+                None, LlamaSession(self.pool.transport, self.pool.command, name=session.name).start
+            )
+        except Exception as e:
+            print(f"[{session.name}] 重建会话失败: {e}", file=sys.stderr)
+            return
+        self.pool.sessions.append(replacement)
+        self.idle.put_nowait(replacement)
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None,
+                     stats: Optional[Dict[str, Any]] = None,
+                     deadline: float = DEFAULT_RESPONSE_DEADLINE,
+                     idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                     max_output_chars: int = DEFAULT_MAX_OUTPUT_CHARS,
+                     cancel_token: Optional[CancelToken] = None) -> AsyncIterator[str]:
+        """租用一个会话，逐段产出回复文本；stats用于取回本次对话的耗时统计
+
+        timeout为等待空闲会话的时间，deadline / idle_timeout / max_output_chars / cancel_token
+        的含义与 LlamaSession.send_message_and_get_response 相同，stats中的stop_reason记录结束原因
+        """
+        session = await self._lease(timeout)
+        stats = {} if stats is None else stats
+        sent_at = time.time()
+        deadline_at = sent_at + deadline if deadline else None
+        stats.update({"sent_at": sent_at, "first_token_latency": None, "complete": False,
+                      "synced": False, "chars": 0})
+        parser = LlamaStreamParser()
+        # 超限或取消后不再产出文本，继续读到提示符为止，使通道与远端重新同步
+        stop_reason = None
+        resync_at = None
+        if cancel_token is not None:
+            cancel_token.attach(session.interrupt)
+        try:
+            try:
+                session.channel.send(prompt + "\n")
+            except Exception as e:
+                session.broken = True
+                raise RuntimeError(f"发送消息时出错: {e}")
+            while not parser.done:
+                if resync_at is not None:
+                    wait = resync_at - time.time()
+                else:
+                    wait = idle_timeout or None
+                    if deadline_at is not None:
+                        remaining = deadline_at - time.time()
+                        wait = remaining if wait is None else min(wait, remaining)
+                data = await self._read(session, max(wait, 0) if wait is not None else None)
+                if stop_reason is None:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        # CancelToken已经发送过Ctrl-C
+                        stop_reason = "cancelled"
+                    elif data == b"":
+                        expired = deadline_at is not None and time.time() >= deadline_at
+                        stop_reason = "deadline" if expired else "idle_timeout"
+                        session.interrupt()
+                    if stop_reason:
+                        resync_at = time.time() + RESYNC_TIMEOUT
+                        if data == b"":
+                            continue
+                elif data == b"":
+                    print(f"[{session.name}] 中断后未能回到提示符", file=sys.stderr)
+                    session.broken = True
+                    break
+                output = parser.finish() if data is None else parser.feed(data)
+                if data is None:
+                    break
+                if stop_reason is not None:
+                    continue
+                if max_output_chars and not parser.done and stats["chars"] + len(output) >= max_output_chars:
+                    output = output[:max_output_chars - stats["chars"]]
+                    stop_reason = "max_output_chars"
+                    resync_at = time.time() + RESYNC_TIMEOUT
+                    session.interrupt()
+                if output:
+                    if stats["first_token_latency"] is None:
+                        stats["first_token_latency"] = time.time() - sent_at
+                    stats["chars"] += len(output)
+                    yield output
+        finally:
+            if cancel_token is not None:
+                cancel_token.detach()
+            if stop_reason is not None:
+                print(f"[{session.name}] 回复被中断({stop_reason})", file=sys.stderr)
+            elif parser.done:
+                stop_reason = "complete"
+            elif session.broken:
+                stop_reason = "closed"
+            else:
+                # 调用方提前退出(或任务被取消)，由_release中断远端生成并在后台丢弃剩余输出
+                stop_reason = "abandoned"
+            synced = parser.done and not session.broken
+            stats["stop_reason"] = stop_reason
+            stats["complete"] = stop_reason == "complete"
+            stats["synced"] = synced
+            stats["total_time"] = time.time() - sent_at
+            self._release(session, synced)
+
+    async def chat(self, prompt: str, timeout: Optional[float] = None, **limits) -> Optional[str]:
+        """非流式调用，返回完整回复；被中断或通道中途关闭时返回None"""
+        stats = {}
+        response = "".join([chunk async for chunk in self.stream(prompt, timeout, stats, **limits)])
+        return response if stats["complete"] else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self.pool.sessions),
+            "in_use": self.in_use,
+            "idle": self.idle.qsize(),
+            "waiting": self.waiting,
+            "leases": self.leases,
+            "timeouts": self.timeouts,
+            "mean_wait": round(self.total_wait / self.leases, 4) if self.leases else 0.0,
+            "max_wait": round(self.max_wait, 4),
+        }
+
+    async def close(self):
+        self.pool.close()
+        if self.ssh_client is not None:
+            self.ssh_client.close()
+
+
+async def _main(args):
+    bridge = await AsyncLlamaBridge.connect(args.pool_size)
+
+    async def _one(index):
+        stats = {}
+        response = "".join([chunk async for chunk in bridge.stream(args.prompt, stats=stats)])
+        print(f"[{index}] 首字延迟 {stats['first_token_latency'] * 1000:.0f}ms, "
+              f"总耗时 {stats['total_time']:.2f}s: {response.strip()}")
+
+    try:
+        if args.concurrency == 1:
+            async for chunk in bridge.stream(args.prompt):
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+            print()
+        else:
+            await asyncio.gather(*(_one(i) for i in range(args.concurrency)))
+        print(bridge.stats())
+    finally:
+        await bridge.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='asyncio流式对话')
+    parser.add_argument('prompt', type=str, help='提问内容')
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help='llama会话数量 (默认: 环境变量LLAMA_POOL_SIZE或1)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='同时发出的对话数 (默认: 1)')
+    args = parser.parse_args()
+    asyncio.run(_main(args))
@@ -0,0 +1,158 @@
+#coding=utf-8
+"""asyncio版本的SpeechService
+
+多个并发的识别请求先进入队列，几毫秒内到达的请求合并为一次批量解码
+(不超过30秒的音频一起送入whisper.decode)，每个请求得到自己的结果以及排队等待和计算耗时。
+同时在途的请求数量有上限，超过时调用方在await处等待。
+"""
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from audio_io import WHISPER_SAMPLE_RATE, decode_audio_bytes
+from speech_service import SpeechService
+
+
+def decode_batch(model, audios: List[np.ndarray], language: str = 'zh') -> List[str]:
+    """批量识别音频；30秒以内的片段合并为一个batch解码，其余逐条transcribe"""
+    texts: List[Optional[str]] = [None] * len(audios)
+    if hasattr(model, "dims"):
+        import torch
+        import whisper
+        short = [i for i, audio in enumerate(audios) if len(audio) <= whisper.audio.N_SAMPLES]
+        if len(short) > 1:
+            n_mels = getattr(model.dims, "n_mels", 80)
+            mels = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audios[i])), n_mels)
+                for i in short
+            ]).to(model.device)
+            options = whisper.DecodingOptions(language=language, without_timestamps=True,
+                                              fp16=model.device.type == "cuda")
+            for i, decoded in zip(short, whisper.decode(model, mels, options)):
+                texts[i] = decoded.text
+    for i, audio in enumerate(audios):
+        if texts[i] is None:
+            texts[i] = model.transcribe(audio, language=language)["text"]
+    return texts
+
+
+class AsyncSpeechService:
+    """带并发上限和动态批处理的异步语音识别门面"""
+
+    def __init__(self, service: Optional[SpeechService] = None, max_batch_size: int = 8,
+                 batch_window: float = 0.005, max_concurrency: int = 32):
+        """
+        service: 共享的SpeechService，默认新建一个
+        max_batch_size: 单次批量解码的最大请求数
+        batch_window: 收到第一个请求后继续收集请求的时间窗口(秒)
+        max_concurrency: 同时在途(排队+计算)的请求上限
+        """
+        # 自己创建的SpeechService在close()时一并关闭
+        self.owns_service = service is None
+        self.service = service or SpeechService()
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_concurrency = max_concurrency
+        # 模型调用只在这一个线程中进行，同时还持有SpeechService的推理锁与同步调用方互斥
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper-batch")
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.batcher: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        if self.batcher is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.queue = asyncio.Queue()
+            self.batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def transcribe_audio(self, audio: np.ndarray) -> Dict[str, Any]:
+        """识别16kHz单声道float32音频数组"""
+        self._ensure_started()
+        async with self.semaphore:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((np.asarray(audio, dtype=np.float32), future, time.perf_counter()))
+            return await future
+
+    async def speech_to_text(self, audio_data: bytes) -> Dict[str, Any]:
+        """异步语音转文本，结果附带queue_wait(排队等待)和compute_time(批量解码)耗时"""
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(None, decode_audio_bytes, audio_data)
+        result = await self.transcribe_audio(audio)
+        duration = len(audio) / WHISPER_SAMPLE_RATE
+        self.service.transcript_store.append(result["text"], duration=round(duration, 3),
+                                             latency=round(time.time() - start_time, 3),
+                                             created_at=start_time, source="async_speech_to_text")
+        return result
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                texts = await loop.run_in_executor(self.executor, self._decode, [item[0] for item in batch])
+                error = None
+            except Exception as e:
+                self.service.logger.error(f"批量语音识别错误: {e}")
+                texts, error = None, e
+            finished = time.perf_counter()
+            self.batches += 1
+            self.requests += len(batch)
+
+            for index, (_, future, enqueued) in enumerate(batch):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(RuntimeError(f"语音识别错误: {error}"))
+                    continue
+                future.set_result({
+                    "text": texts[index],
+                    "success": True,
+                    "batch_size": len(batch),
+                    "queue_wait": round(started - enqueued, 4),
+                    "compute_time": round(finished - started, 4),
+                })
+
+    def _decode(self, audios: List[np.ndarray]) -> List[str]:
+        model = self.service.get_whisper_model()
+        with self.service.inference_lock:
+            return decode_batch(model, audios)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+        }
+
+    async def close(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+            self.batcher = None
+        self.executor.shutdown(wait=False)
+        if self.owns_service:
+            self.service.close()
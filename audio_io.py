@@ -0,0 +1,195 @@
+#coding=utf-8
+"""进程内音频解码工具
+
+把WAV/PCM字节直接解码并重采样为Whisper所需的16kHz单声道float32数组，
+不写临时文件、不启动ffmpeg进程；只有压缩格式(mp3/ogg/webm等)才回退到ffmpeg管道。
+"""
+import os
+import struct
+import subprocess
+from typing import Tuple
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def is_wav_bytes(data: bytes) -> bool:
+    return len(data) >= 12 and data[:4] in (b"RIFF", b"RIFX") and data[8:12] == b"WAVE"
+
+
+def pcm_to_float32(pcm: bytes, sample_width: int, channels: int = 1,
+                   is_float: bool = False) -> np.ndarray:
+    """把交错的PCM样本转换为[-1, 1]范围的float32数组，多声道时取平均为单声道"""
+    usable = len(pcm) - len(pcm) % (sample_width * channels)
+    pcm = pcm[:usable]
+    if is_float:
+        dtype = {4: "<f4", 8: "<f8"}.get(sample_width)
+        if dtype is None:
+            raise ValueError(f"不支持的浮点采样位宽: {sample_width * 8}bit")
+        audio = np.frombuffer(pcm, dtype=dtype).astype(np.float32)
+    elif sample_width == 1:
+        audio = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32)
+                   | (raw[:, 1].astype(np.int32) << 8)
+                   | (raw[:, 2].astype(np.int32) << 16))
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        audio = samples.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        audio = np.frombuffer(pcm, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"不支持的采样位宽: {sample_width * 8}bit")
+
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return audio
+
+
+def parse_wav_bytes(data: bytes) -> Tuple[np.ndarray, int]:
+    """解析WAV字节，返回(单声道float32样本, 采样率)"""
+    if data[:4] == b"RIFX":
+        raise ValueError("不支持大端序WAV")
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body_start = offset + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body_start)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # 子格式GUID的前两个字节即实际格式
+                format_tag = struct.unpack_from("<H", data, body_start + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV缺少fmt块")
+            format_tag, channels, sample_rate, bits = fmt
+            if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                raise ValueError(f"不支持的WAV编码格式: 0x{format_tag:04x}")
+            # 流式录音的data块长度可能未回填(0或0xFFFFFFFF)，此时读到文件末尾
+            end = len(data) if chunk_size in (0, 0xFFFFFFFF) else min(len(data), body_start + chunk_size)
+            audio = pcm_to_float32(data[body_start:end], (bits + 7) // 8, channels,
+                                   is_float=format_tag == WAVE_FORMAT_IEEE_FLOAT)
+            return audio, sample_rate
+        offset = body_start + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV缺少data块")
+
+
+def _lowpass(audio: np.ndarray, cutoff: float, taps: int = 63) -> np.ndarray:
+    """加窗sinc低通滤波，cutoff为相对采样率的截止频率(0~0.5)"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    kernel /= kernel.sum()
+    # mode="same"在输入比滤波器短时会返回len(kernel)个样本，这里按输入长度截取中间部分
+    filtered = np.convolve(audio, kernel.astype(np.float32), mode="full")
+    start = (taps - 1) // 2
+    return filtered[start:start + len(audio)]
+
+
+def resample_audio(audio: np.ndarray, orig_sr: int, target_sr: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """重采样到目标采样率，降采样前先低通滤波防止混叠"""
+    audio = np.asarray(audio, dtype=np.float32)
+    if orig_sr == target_sr or len(audio) == 0:
+        return audio
+    # 输出长度只由输入长度和采样率决定
+    n_out = int(round(len(audio) * target_sr / orig_sr))
+    if target_sr < orig_sr:
+        audio = _lowpass(audio, 0.5 * target_sr / orig_sr)
+    positions = np.arange(n_out) * (orig_sr / target_sr)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def decode_with_ffmpeg(source, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """通过ffmpeg管道解码压缩音频，source为字节或文件路径，输出直接从stdout读取"""
+    from_bytes = isinstance(source, (bytes, bytearray))
+    command = [
+        'ffmpeg', '-hide_banner',
+        '-i', 'pipe:0' if from_bytes else source,
+        '-f', 'f32le',
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        'pipe:1'
+    ]
+    try:
+        result = subprocess.run(command, input=bytes(source) if from_bytes else b"",
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        raise RuntimeError(f"音频转换失败: {e}")
+    return np.frombuffer(result.stdout, dtype="<f4").astype(np.float32)
+
+
+def decode_audio_bytes(data: bytes, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """把音频字节解码为指定采样率的单声道float32数组，WAV在进程内解码，其他格式回退ffmpeg"""
+    if is_wav_bytes(data):
+        try:
+            audio, orig_sr = parse_wav_bytes(data)
+            return resample_audio(audio, orig_sr, sample_rate)
+        except ValueError:
+            pass
+    return decode_with_ffmpeg(data, sample_rate)
+
+
+def decode_pcm_bytes(pcm: bytes, orig_sr: int, sample_width: int = 2, channels: int = 1,
+                     sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """解码无头的原始PCM数据(例如麦克风采集的数据)"""
+    return resample_audio(pcm_to_float32(pcm, sample_width, channels), orig_sr, sample_rate)
+
+
+def encode_wav_bytes(audio: np.ndarray, sample_rate: int = WHISPER_SAMPLE_RATE) -> bytes:
+    """把单声道float32样本编码为16bit PCM WAV字节"""
+    pcm = (np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16,
+                         WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16, b"data", len(pcm))
+    return header + pcm
+
+
+def load_audio_file(path: str, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """读取音频文件，WAV在进程内解码，其他格式由ffmpeg直接读取文件"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if is_wav_bytes(header):
+            return decode_audio_bytes(header + f.read(), sample_rate)
+    return decode_with_ffmpeg(path, sample_rate)
+
+
+def get_audio_duration(path: str) -> float:
+    """获取音频时长(秒)，WAV只读取文件头，其他格式使用ffprobe，失败时返回0"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(4096)
+        if is_wav_bytes(header):
+            offset = 12
+            byte_rate = None
+            while offset + 8 <= len(header):
+                chunk_id = header[offset:offset + 4]
+                chunk_size = struct.unpack_from("<I", header, offset + 4)[0]
+                if chunk_id == b"fmt ":
+                    byte_rate = struct.unpack_from("<I", header, offset + 16)[0]
+                elif chunk_id == b"data" and byte_rate:
+                    data_size = os.path.getsize(path) - offset - 8
+                    if chunk_size not in (0, 0xFFFFFFFF):
+                        data_size = min(data_size, chunk_size)
+                    return data_size / byte_rate
+                offset += 8 + chunk_size + (chunk_size & 1)
+    except (OSError, struct.error):
+        return 0.0
+    command = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        path
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        return float(result.stdout.strip() or 0)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        return 0.0
@@ -0,0 +1,122 @@
+#coding=utf-8
+"""批量语音转写
+
+使用多个工作进程(每个进程持有自己的Whisper模型)转写大量录音，结果以JSONL逐条输出:
+
+    python batch_transcribe.py recordings/ --workers 4 --model small --output result.jsonl
+
+输入按音频时长从长到短排序后分发，减少末尾长文件拖慢整体以及同批时长差异带来的填充浪费，
+结束时输出实时率(RTF = 墙钟时间 / 音频总时长)和每秒处理文件数。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from audio_io import get_audio_duration, load_audio_file
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg', '.webm', '.aac', '.opus')
+
+# 工作进程内的模型实例
+_worker_model = None
+_worker_language = 'zh'
+
+
+def _init_worker(model_size: str, language: str):
+    global _worker_model, _worker_language
+    import whisper
+    _worker_model = whisper.load_model(model_size)
+    _worker_language = language
+
+
+def _transcribe_file(path: str, duration: float) -> Dict[str, Any]:
+    start_time = time.time()
+    try:
+        audio = load_audio_file(path)
+        result = _worker_model.transcribe(audio, language=_worker_language)
+        text = result["text"]
+        error = None
+    except Exception as e:
+        text = ""
+        error = str(e)
+    return {
+        "path": path,
+        "text": text,
+        "duration": round(duration, 3),
+        "elapsed": round(time.time() - start_time, 3),
+        "success": error is None,
+        "error": error,
+        "pid": os.getpid(),
+    }
+
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """展开目录为其中的音频文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def transcribe_many(paths: Iterable[str], workers: Optional[int] = None, model_size: str = 'small',
+                    language: str = 'zh') -> Iterator[Dict[str, Any]]:
+    """并行转写多个音频文件，按完成顺序逐条产出结果"""
+    durations = {path: get_audio_duration(path) for path in expand_paths(paths)}
+    ordered = sorted(durations, key=durations.get, reverse=True)
+    if not ordered:
+        return
+    workers = max(1, min(workers or os.cpu_count() or 1, len(ordered)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_size, language)) as pool:
+        futures = [pool.submit(_transcribe_file, path, durations[path]) for path in ordered]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(results: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    """汇总吞吐指标"""
+    audio_seconds = sum(r["duration"] for r in results)
+    return {
+        "files": len(results),
+        "failed": sum(1 for r in results if not r["success"]),
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall_time, 2),
+        "real_time_factor": round(wall_time / audio_seconds, 4) if audio_seconds else None,
+        "files_per_second": round(len(results) / wall_time, 3) if wall_time else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='批量语音转写')
+    parser.add_argument('paths', nargs='+',
+                        help='音频文件或包含音频文件的目录')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='工作进程数 (默认: CPU核数)')
+    parser.add_argument('--model', type=str, default=os.environ.get("WHISPER_MODEL_SIZE", "small"),
+                        help='Whisper模型大小 (默认: small)')
+    parser.add_argument('--language', type=str, default='zh',
+                        help='识别语言 (默认: zh)')
+    parser.add_argument('--output', type=str, default='',
+                        help='JSONL输出文件路径 (默认: 标准输出)')
+    args = parser.parse_args()
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    results = []
+    start = time.time()
+    try:
+        for item in transcribe_many(args.paths, args.workers, args.model, args.language):
+            results.append(item)
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summarize(results, time.time() - start), ensure_ascii=False), file=sys.stderr)
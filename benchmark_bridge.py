@@ -0,0 +1,209 @@
+#coding=utf-8
+"""对话桥接基准测试
+
+在本机启动 fake_llama_server 模拟的llama SSH服务器，不需要GPU服务器即可测量:
+首字延迟(TTFT)、调用方实际收到的token速率，以及不同并发数下的排队和吞吐表现。
+可以直接测会话池(direct)，也可以经过 llm_bridge 的本地socket(bridge)。结果输出为JSON:
+
+    python benchmark_bridge.py --concurrency 1 2 4 --pool-size 2 --output bridge_result.json
+    python benchmark_bridge.py --mode bridge --tokens-per-second 50
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import threading
+from typing import Any, Dict, List
+
+import paramiko
+
+from fake_llama_server import FakeLlamaServer
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_request(stream) -> Dict[str, Any]:
+    """消费一次流式回复，记录调用方看到的首字延迟和token速率"""
+    started_at = time.time()
+    first_at = None
+    chunks = 0
+    chars = 0
+    error = None
+    try:
+        for chunk in stream:
+            if first_at is None:
+                first_at = time.time()
+            chunks += 1
+            chars += len(chunk)
+    except Exception as e:
+        error = str(e)
+    finished_at = time.time()
+    streaming = finished_at - first_at if first_at is not None else 0.0
+    return {
+        "ttft": first_at - started_at if first_at is not None else None,
+        "total_time": finished_at - started_at,
+        "chunks": chunks,
+        "chars": chars,
+        # 模拟服务器每个token是一个字符
+        "tokens_per_second": chars / streaming if streaming > 0 else 0.0,
+        "error": error,
+    }
+
+
+def bench_concurrency(stream_factory, concurrency: int, requests: int) -> Dict[str, Any]:
+    """concurrency个线程共发出requests次对话"""
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def _worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            result = run_request(stream_factory(f"测试问题{index}"))
+            with lock:
+                results.append(result)
+
+    started_at = time.time()
+    threads = [threading.Thread(target=_worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started_at
+
+    ok = [r for r in results if r["error"] is None and r["ttft"] is not None]
+    ttfts = [r["ttft"] for r in ok]
+    totals = [r["total_time"] for r in ok]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(results) - len(ok),
+        "elapsed": round(elapsed, 3),
+        "requests_per_second": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "ttft_p50_ms": round(percentile(ttfts, 50) * 1000, 1),
+        "ttft_p95_ms": round(percentile(ttfts, 95) * 1000, 1),
+        "total_p50_ms": round(percentile(totals, 50) * 1000, 1),
+        "total_p95_ms": round(percentile(totals, 95) * 1000, 1),
+        "tokens_per_second": round(sum(r["tokens_per_second"] for r in ok) / len(ok), 1) if ok else 0.0,
+        "aggregate_tokens_per_second": round(sum(r["chars"] for r in ok) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def pool_delta(before: Dict[str, Any], after: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    """两次会话池统计之差，只反映这一并发数下的租用、超时、等待和利用率"""
+    leases = after["leases"] - before["leases"]
+    total_wait = after["total_wait"] - before["total_wait"]
+    busy_time = after["busy_time"] - before["busy_time"]
+    return {
+        "size": after["size"],
+        "leases": leases,
+        "timeouts": after["timeouts"] - before["timeouts"],
+        "mean_wait": round(total_wait / leases, 4) if leases else 0.0,
+        "utilization": round(busy_time / (elapsed * max(after["size"], 1)), 4) if elapsed > 0 else 0.0,
+    }
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    server = FakeLlamaServer(tokens=list(args.tokens) if args.tokens else None,
+                             tokens_per_second=args.tokens_per_second,
+                             startup_delay=args.startup_delay, prompt_delay=args.prompt_delay).start()
+    # ssh.create_session_pool 和 llm_bridge 都通过环境变量连接到模拟服务器
+    os.environ.update({
+        "LLAMA_SSH_HOST": server.host,
+        "LLAMA_SSH_PORT": str(server.port),
+        "LLAMA_SSH_USER": server.username,
+        "LLAMA_SSH_PASSWORD": server.password,
+    })
+    paramiko.util.get_logger("paramiko").setLevel("WARNING")
+
+    from ssh import create_session_pool
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "pool_size": args.pool_size,
+        "server_tokens_per_second": args.tokens_per_second,
+        "server_prompt_delay": args.prompt_delay,
+        "response_tokens": len(server.tokens),
+    }
+
+    connect_started = time.time()
+    if args.mode == "bridge":
+        from llm_bridge import BridgeClient, BridgeDaemon
+        address = f"127.0.0.1:{find_free_port()}"
+        daemon = BridgeDaemon(address, args.pool_size)
+        threading.Thread(target=daemon.serve_forever, name="bench-bridge", daemon=True).start()
+        daemon.ready.wait()
+        client = BridgeClient(address)
+        while not client.ping():
+            time.sleep(0.05)
+        report["connect_time"] = round(time.time() - connect_started, 3)
+        stream_factory = lambda prompt: client.stream(prompt, args.timeout)
+        pool_stats = lambda: client.stats()["pool"]
+    else:
+        ssh_client, pool = create_session_pool(args.pool_size)
+        report["connect_time"] = round(time.time() - connect_started, 3)
+        stream_factory = lambda prompt: pool.send_message_and_get_response(prompt, args.timeout)
+        pool_stats = pool.stats
+
+    report["levels"] = []
+    for concurrency in args.concurrency:
+        print(f"正在测试并发数: {concurrency}", file=sys.stderr)
+        before = pool_stats()
+        level = bench_concurrency(stream_factory, concurrency, args.requests or concurrency * 4)
+        level["pool"] = pool_delta(before, pool_stats(), level["elapsed"])
+        report["levels"].append(level)
+
+    server.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='对话桥接基准测试')
+    parser.add_argument('--mode', choices=['direct', 'bridge'], default='direct',
+                        help='直接使用会话池或经过llm_bridge (默认: direct)')
+    parser.add_argument('--pool-size', type=int, default=1,
+                        help='llama会话数量 (默认: 1)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4],
+                        help='要测试的并发数 (默认: 1 2 4)')
+    parser.add_argument('--requests', type=int, default=0,
+                        help='每个并发数下的请求数 (默认: 并发数的4倍)')
+    parser.add_argument('--tokens-per-second', type=float, default=20.0,
+                        help='模拟服务器每秒输出的token数 (默认: 20)')
+    parser.add_argument('--tokens', type=str, default='',
+                        help='模拟回复文本，按字符切分为token (默认: 内置中文句子)')
+    parser.add_argument('--startup-delay', type=float, default=0.0,
+                        help='模拟模型加载耗时(秒)')
+    parser.add_argument('--prompt-delay', type=float, default=0.2,
+                        help='模拟处理提问的耗时(秒) (默认: 0.2)')
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help='等待空闲会话的超时(秒) (默认: 120)')
+    parser.add_argument('--output', type=str, default='',
+                        help='JSON结果输出路径 (默认: 标准输出)')
+    args = parser.parse_args()
+
+    text = json.dumps(run_benchmark(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
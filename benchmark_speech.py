@@ -0,0 +1,243 @@
+#coding=utf-8
+"""语音识别/合成基准测试
+
+离线运行，使用 benchmark_fixtures/ 中的中文短句音频，对每个Whisper模型大小分别测量:
+模型加载时间、音频转换时间、识别延迟、实时率(RTF)、字错误率(CER)和进程峰值内存，
+并测量TTS每个字符的合成时间。结果输出为JSON，便于不同运行之间对比:
+
+    python benchmark_speech.py --generate-fixtures      # 首次运行: 用本机TTS生成测试音频
+    python benchmark_speech.py --models tiny base small --output bench_result.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, List
+
+from audio_io import WHISPER_SAMPLE_RATE, decode_audio_bytes, encode_wav_bytes, load_audio_file
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_fixtures")
+
+
+def load_manifest(fixtures_dir: str = FIXTURES_DIR) -> List[Dict[str, Any]]:
+    with open(os.path.join(fixtures_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+        clips = json.load(f)["clips"]
+    for clip in clips:
+        clip["path"] = os.path.join(fixtures_dir, clip["file"])
+    return clips
+
+
+def get_peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存(MB)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def character_error_rate(reference: str, hypothesis: str) -> float:
+    """忽略标点和空白的字错误率(编辑距离 / 参考文本长度)"""
+    def _normalize(text):
+        return [c for c in text if c.isalnum()]
+
+    ref, hyp = _normalize(reference), _normalize(hypothesis)
+    if not ref:
+        return float(bool(hyp))
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def generate_fixtures(voice: str = "zh", rate: int = 170):
+    """用本机pyttsx3中文音色生成测试音频并统一为16kHz单声道WAV"""
+    import pyttsx3
+    engine = pyttsx3.init()
+    for v in engine.getProperty('voices'):
+        if voice in v.id or voice in v.name or any(voice in str(lang) for lang in v.languages):
+            engine.setProperty('voice', v.id)
+            break
+    engine.setProperty('rate', rate)
+    clips = load_manifest()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        raw_paths = {}
+        for clip in clips:
+            raw_paths[clip["id"]] = os.path.join(tmp_dir, clip["id"] + ".wav")
+            engine.save_to_file(clip["text"], raw_paths[clip["id"]])
+        engine.runAndWait()
+        for clip in clips:
+            audio = load_audio_file(raw_paths[clip["id"]])
+            with open(clip["path"], 'wb') as f:
+                f.write(encode_wav_bytes(audio, WHISPER_SAMPLE_RATE))
+            print(f"已生成: {clip['path']} ({len(audio) / WHISPER_SAMPLE_RATE:.1f}秒)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_conversion(clips: List[Dict[str, Any]], repeats: int = 5) -> Dict[str, Any]:
+    """比较进程内解码与旧的ffmpeg临时文件转换的耗时"""
+    in_memory = []
+    ffmpeg = []
+    for clip in clips:
+        with open(clip["path"], 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            decode_audio_bytes(data)
+        in_memory.append((time.perf_counter() - start) / repeats)
+        if shutil.which("ffmpeg"):
+            output_path = os.path.join(tempfile.gettempdir(), f"bench_{clip['id']}_converted.wav")
+            start = time.perf_counter()
+            subprocess.run(['ffmpeg', '-y', '-i', clip["path"], '-ar', '16000', '-ac', '1', '-f', 'wav', output_path],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            load_audio_file(output_path)
+            ffmpeg.append(time.perf_counter() - start)
+            os.unlink(output_path)
+    result = {"in_memory_ms": round(1000 * sum(in_memory) / len(in_memory), 3)}
+    if ffmpeg:
+        result["ffmpeg_ms"] = round(1000 * sum(ffmpeg) / len(ffmpeg), 3)
+    return result
+
+
+def bench_model(model_size: str, clips: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """在当前进程中测量一个模型大小，应在独立子进程中调用以便峰值内存互不影响"""
+    import whisper
+    from speech_service import get_model_memory_mb
+
+    rss_before = get_peak_rss_mb()
+    start = time.perf_counter()
+    model = whisper.load_model(model_size)
+    load_time = time.perf_counter() - start
+
+    audios = [load_audio_file(clip["path"]) for clip in clips]
+    # 预热一次，避免首次推理的初始化开销计入延迟
+    model.transcribe(audios[0], language='zh')
+
+    per_clip = []
+    for clip, audio in zip(clips, audios):
+        duration = len(audio) / WHISPER_SAMPLE_RATE
+        start = time.perf_counter()
+        text = model.transcribe(audio, language='zh')["text"]
+        latency = time.perf_counter() - start
+        per_clip.append({
+            "id": clip["id"],
+            "duration": round(duration, 3),
+            "latency": round(latency, 4),
+            "rtf": round(latency / duration, 4) if duration else None,
+            "cer": round(character_error_rate(clip["text"], text), 4),
+            "text": text,
+        })
+
+    total_audio = sum(c["duration"] for c in per_clip)
+    total_latency = sum(c["latency"] for c in per_clip)
+    return {
+        "model": model_size,
+        "load_time": round(load_time, 3),
+        "model_memory_mb": round(get_model_memory_mb(model), 1),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        "peak_rss_before_load_mb": round(rss_before, 1),
+        "mean_latency": round(total_latency / len(per_clip), 4),
+        "rtf": round(total_latency / total_audio, 4) if total_audio else None,
+        "mean_cer": round(sum(c["cer"] for c in per_clip) / len(per_clip), 4),
+        "clips": per_clip,
+    }
+
+
+def bench_tts(clips: List[Dict[str, Any]], rate: int = 200) -> Dict[str, Any]:
+    """测量TTS每字符的合成时间(只合成到文件，不播放，不命中缓存)"""
+    from tts_cache import TTSCache
+    from tts_worker import TTSWorker
+
+    cache_dir = tempfile.mkdtemp()
+    worker = TTSWorker(TTSCache(cache_dir))
+    try:
+        per_clip = []
+        for clip in clips:
+            start = time.perf_counter()
+            worker.speak(clip["text"], rate=rate, play=False, split=False).result()
+            elapsed = time.perf_counter() - start
+            per_clip.append({
+                "id": clip["id"],
+                "chars": len(clip["text"]),
+                "synthesis_time": round(elapsed, 4),
+                "ms_per_char": round(1000 * elapsed / len(clip["text"]), 3),
+            })
+        total_chars = sum(c["chars"] for c in per_clip)
+        total_time = sum(c["synthesis_time"] for c in per_clip)
+        return {
+            "rate": rate,
+            "ms_per_char": round(1000 * total_time / total_chars, 3),
+            "clips": per_clip,
+        }
+    finally:
+        worker.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def run_model_in_subprocess(model_size: str) -> Dict[str, Any]:
+    command = [sys.executable, os.path.abspath(__file__), "--model-worker", model_size]
+    result = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='语音识别/合成基准测试')
+    parser.add_argument('--models', nargs='+', default=['tiny', 'base', 'small'],
+                        help='要测试的Whisper模型大小 (默认: tiny base small)')
+    parser.add_argument('--skip-tts', action='store_true',
+                        help='跳过TTS测试')
+    parser.add_argument('--output', type=str, default='',
+                        help='JSON结果输出路径 (默认: 标准输出)')
+    parser.add_argument('--generate-fixtures', action='store_true',
+                        help='用本机TTS生成测试音频后退出')
+    parser.add_argument('--model-worker', type=str, default='',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate_fixtures:
+        generate_fixtures()
+        sys.exit(0)
+
+    clips = load_manifest()
+    missing = [clip["file"] for clip in clips if not os.path.exists(clip["path"])]
+    if missing:
+        print(f"缺少测试音频: {', '.join(missing)}，请先运行 --generate-fixtures", file=sys.stderr)
+        sys.exit(1)
+
+    if args.model_worker:
+        print(json.dumps(bench_model(args.model_worker, clips), ensure_ascii=False))
+        sys.exit(0)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "clips": len(clips),
+        "audio_seconds": round(sum(len(load_audio_file(c["path"])) for c in clips) / WHISPER_SAMPLE_RATE, 3),
+        "conversion": bench_conversion(clips),
+        "stt": [],
+    }
+    for model_size in args.models:
+        print(f"正在测试Whisper模型: {model_size}", file=sys.stderr)
+        report["stt"].append(run_model_in_subprocess(model_size))
+    if not args.skip_tts:
+        report["tts"] = bench_tts(clips)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,233 @@
+#coding=utf-8
+"""聊天界面中的摄像头预览
+
+后台线程从 windows_camera_server 的MJPEG流中解码画面(mjpeg_stream只依赖OpenCV)，另一个线程
+按固定间隔做人脸检测和情绪识别(ubuntu_emotion_client1 依赖TensorFlow/DeepFace，只在开启分析时
+于后台线程中导入，识别模型在进程内只加载一次)。
+解码出的numpy帧直接包装成QImage显示，不做额外复制；界面还没画完上一帧时新帧只替换
+"最新帧"而不排队，界面繁忙时自动丢帧。人脸框和中文情绪标签用QPainter叠加绘制。
+
+视频流地址默认读取环境变量 CAMERA_STREAM_URL。
+"""
+import os
+import time
+import threading
+
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QObject, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter, QPen
+
+DEFAULT_CAMERA_URL = os.environ.get("CAMERA_STREAM_URL", "http://127.0.0.1:5000/video_feed")
+# 人脸检测+情绪识别很慢，只对最新帧按间隔分析，画面上沿用最近一次的结果
+ANALYZE_INTERVAL = 0.5
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+
+def get_emotion_recognizer():
+    """进程内共享的情绪识别模型，第一次开启分析时加载，之后重复开关摄像头不再重新加载"""
+    global _recognizer
+    with _recognizer_lock:
+        if _recognizer is None:
+            from ubuntu_emotion_client1 import EmotionRecognizer
+            _recognizer = EmotionRecognizer()
+        return _recognizer
+
+
+class CameraStream(QObject):
+    """解码线程 + 分析线程，界面通过take_frame()取最新帧和人脸结果"""
+    frameReady = pyqtSignal()
+    statusChanged = pyqtSignal(str)
+
+    def __init__(self, url=DEFAULT_CAMERA_URL, analyze=True, analyze_interval=ANALYZE_INTERVAL):
+        super().__init__()
+        self.url = url
+        self.analyze = analyze
+        self.analyze_interval = analyze_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reader = None
+        self.frame = None
+        self.frame_id = 0
+        # 每项为 (top, right, bottom, left, 情绪, 置信度)
+        self.faces = []
+        # 界面正在显示上一帧时为True，此时新帧不再通知界面
+        self.displaying = False
+        self.decoded = 0
+        self.dropped = 0
+
+    def start(self):
+        threading.Thread(target=self._decode_loop, name="camera-decode", daemon=True).start()
+        if self.analyze:
+            threading.Thread(target=self._analyze_loop, name="camera-analyze", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        # 断开视频流，让阻塞在read_frame中的解码线程退出
+        if self.reader is not None:
+            self.reader.close()
+
+    def take_frame(self):
+        with self.lock:
+            return self.frame, self.faces
+
+    def frame_consumed(self):
+        with self.lock:
+            self.displaying = False
+
+    def _decode_loop(self):
+        self.statusChanged.emit("正在连接摄像头...")
+        try:
+            from mjpeg_stream import MJPEGStreamReader
+        except Exception as e:
+            self.statusChanged.emit(f"无法加载视频流模块: {e}")
+            return
+        self.reader = MJPEGStreamReader(self.url)
+        # 连接期间调用了stop()时，stop()还看不到reader，在这里断开
+        if self.stopped.is_set():
+            self.reader.close()
+        while not self.stopped.is_set():
+            ok, frame = self.reader.read_frame()
+            if self.stopped.is_set():
+                break
+            if not ok or frame is None:
+                self.statusChanged.emit("无法读取视频帧，正在重新连接...")
+                time.sleep(1)
+                continue
+            with self.lock:
+                self.frame = frame
+                self.frame_id += 1
+                self.decoded += 1
+                busy = self.displaying
+                if busy:
+                    self.dropped += 1
+                else:
+                    self.displaying = True
+            if not busy:
+                self.frameReady.emit()
+
+    def _analyze_loop(self):
+        try:
+            import cv2
+            import face_recognition
+            recognizer = get_emotion_recognizer()
+        except Exception as e:
+            self.statusChanged.emit(f"情绪识别不可用: {e}")
+            return
+        last_id = 0
+        while not self.stopped.is_set():
+            with self.lock:
+                frame, frame_id = self.frame, self.frame_id
+            if frame is None or frame_id == last_id:
+                time.sleep(0.05)
+                continue
+            last_id = frame_id
+            started_at = time.time()
+            faces = []
+            for (top, right, bottom, left) in face_recognition.face_locations(frame, model="cnn"):
+                try:
+                    face_img = cv2.resize(frame[top:bottom, left:right], (48, 48))
+                    _, emotion_cn, confidence = recognizer.predict_emotion(face_img)
+                except Exception as e:
+                    print(f"处理人脸时错误: {str(e)}")
+                    continue
+                faces.append((top, right, bottom, left, emotion_cn, confidence))
+            with self.lock:
+                self.faces = faces
+            time.sleep(max(self.analyze_interval - (time.time() - started_at), 0))
+
+
+def frame_to_qimage(frame):
+    """把BGR的numpy帧包装成QImage，共享同一块内存(调用方需保持frame存活)"""
+    height, width = frame.shape[:2]
+    if hasattr(QImage, "Format_BGR888"):
+        return QImage(frame.data, width, height, frame.strides[0], QImage.Format_BGR888)
+    # Qt 5.14以前没有BGR888格式，只能转换一次通道顺序
+    rgb = frame[:, :, ::-1].copy()
+    image = QImage(rgb.data, width, height, rgb.strides[0], QImage.Format_RGB888)
+    image.buffer = rgb
+    return image
+
+
+class CameraPreview(QWidget):
+    """显示摄像头画面并叠加人脸框和情绪标签"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.stream = None
+        self.frame = None
+        self.image = None
+        self.faces = []
+        self.status = "摄像头未开启"
+        self.label_font = QFont()
+        self.label_font.setPixelSize(14)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def start(self, url=None):
+        self.stop()
+        self.stream = CameraStream(url or DEFAULT_CAMERA_URL)
+        self.stream.frameReady.connect(self.on_frame_ready)
+        self.stream.statusChanged.connect(self.on_status_changed)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.frameReady.disconnect(self.on_frame_ready)
+            self.stream.statusChanged.disconnect(self.on_status_changed)
+            self.stream = None
+        self.frame = None
+        self.image = None
+        self.faces = []
+        self.status = "摄像头未开启"
+        self.update()
+
+    def on_status_changed(self, status):
+        self.status = status
+        if self.image is None:
+            self.update()
+
+    def on_frame_ready(self):
+        if self.stream is None:
+            return
+        frame, faces = self.stream.take_frame()
+        # 保持对numpy帧的引用，QImage直接使用它的内存
+        self.frame = frame
+        self.image = frame_to_qimage(frame)
+        self.faces = faces
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), QColor("#232428"))
+        try:
+            if self.image is None:
+                painter.setPen(QColor("#99AAB5"))
+                painter.drawText(self.rect(), Qt.AlignCenter | Qt.TextWordWrap, self.status)
+                return
+            width, height = self.image.width(), self.image.height()
+            scale = min(self.width() / width, self.height() / height)
+            target = QRectF((self.width() - width * scale) / 2, (self.height() - height * scale) / 2,
+                            width * scale, height * scale)
+            painter.drawImage(target, self.image)
+
+            painter.setFont(self.label_font)
+            for top, right, bottom, left, emotion_cn, confidence in self.faces:
+                box = QRectF(target.x() + left * scale, target.y() + top * scale,
+                             (right - left) * scale, (bottom - top) * scale)
+                painter.setPen(QPen(QColor(0, 255, 0), 2))
+                painter.setBrush(Qt.NoBrush)
+                painter.drawRect(box)
+                label = f"{emotion_cn} {confidence * 100:.0f}%"
+                label_rect = QRectF(box.x(), box.y() - 20, max(box.width(), 80), 20)
+                painter.fillRect(label_rect, QColor(0, 0, 0, 160))
+                painter.setPen(QColor("white"))
+                painter.drawText(label_rect, Qt.AlignLeft | Qt.AlignVCenter, label)
+        finally:
+            painter.end()
+            # 这一帧已经画完，允许解码线程通知下一帧
+            if self.stream is not None and self.image is not None:
+                self.stream.frame_consumed()
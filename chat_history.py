@@ -0,0 +1,109 @@
+#coding=utf-8
+"""聊天记录存储
+
+对话和消息只追加写入同一个SQLite数据库，写入由后台线程批量提交(见sqlite_store)，GUI线程不会被磁盘IO阻塞。
+读取按消息id分页(WHERE id < ? ORDER BY id DESC LIMIT ?，走索引)，打开很长的历史对话时
+只需读取最近一页，向上滚动时再按需加载更早的消息。
+"""
+import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlite_store import BatchedSQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    is_ai INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+"""
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class ChatHistoryStore(BatchedSQLiteStore):
+    """追加写入的聊天记录库，写入在后台线程中批量提交"""
+
+    SCHEMA = SCHEMA
+    STORE_NAME = "聊天记录"
+    THREAD_NAME = "chat-history-writer"
+    LOGGER_NAME = "chat_history"
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval: float = 0.5):
+        super().__init__(db_path, batch_size, flush_interval)
+        # 读取使用单独的连接，与写入线程互不阻塞(WAL模式)
+        self.reader = self._connect(check_same_thread=False)
+        self.reader_lock = threading.Lock()
+
+    def create_conversation(self, title: Optional[str] = None, created_at: Optional[float] = None) -> str:
+        """新建对话，立即返回对话id"""
+        conversation_id = uuid.uuid4().hex
+        self._submit(("conversation", (
+            conversation_id, title, created_at if created_at is not None else time.time(),
+        )))
+        return conversation_id
+
+    def append_message(self, conversation_id: str, text: str, is_ai: bool,
+                       created_at: Optional[float] = None):
+        """登记一条消息，立即返回"""
+        self._submit(("message", (
+            conversation_id, created_at if created_at is not None else time.time(), int(is_ai), text,
+        )))
+
+    def _write_batch(self, conn, batch):
+        # 按提交顺序写入，保证对话先于其中的消息
+        for kind, row in batch:
+            if kind == "conversation":
+                conn.execute("INSERT INTO conversations (id, title, created_at) VALUES (?, ?, ?)", row)
+            else:
+                conn.execute("INSERT INTO messages (conversation_id, created_at, is_ai, text) "
+                             "VALUES (?, ?, ?, ?)", row)
+
+    def _query(self, sql: str, params) -> list:
+        with self.reader_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    def latest_conversation(self) -> Optional[str]:
+        """最近有消息(或最近创建)的对话id"""
+        rows = self._query(
+            "SELECT id FROM conversations ORDER BY "
+            "COALESCE((SELECT MAX(id) FROM messages WHERE conversation_id = conversations.id), 0) DESC, "
+            "created_at DESC LIMIT 1", ())
+        return rows[0][0] if rows else None
+
+    def list_conversations(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT id, title, created_at FROM conversations ORDER BY created_at DESC LIMIT ?",
+                           (limit,))
+        return [{"id": row_id, "title": title, "created_at": created_at} for row_id, title, created_at in rows]
+
+    def load_page(self, conversation_id: str, before_id: Optional[int] = None,
+                  limit: int = DEFAULT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """读取id小于before_id的最近limit条消息(不传则为最新一页)，按时间升序返回"""
+        sql = "SELECT id, created_at, is_ai, text FROM messages WHERE conversation_id = ?"
+        params: List[Any] = [conversation_id]
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._query(sql, params)
+        return [
+            {"id": row_id, "created_at": created_at, "is_ai": bool(is_ai), "text": text}
+            for row_id, created_at, is_ai, text in reversed(rows)
+        ]
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            with self.reader_lock:
+                self.reader.close()
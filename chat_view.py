@@ -0,0 +1,243 @@
+#coding=utf-8
+"""聊天记录的模型/视图实现
+
+每条消息只是一个很小的数据记录(ChatMessage)，由 ChatMessageModel 保存，
+ChatBubbleDelegate 直接用QPainter绘制头像和气泡，QListView只渲染可见的行，
+上万条消息时内存和滚动开销也基本不变。每条消息的文字排版结果按视图宽度缓存，
+流式追加文本时只有该消息需要重新计算，行高变化时才通知视图重新布局。
+"""
+import time
+
+from PyQt5.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter, QPen
+
+MessageRole = Qt.UserRole + 1
+
+AI_BUBBLE_COLOR = QColor("#7289DA")
+USER_BUBBLE_COLOR = QColor("#4CAF50")
+AVATAR_SIZE = 40
+AVATAR_SPACING = 8
+ROW_MARGIN = 6
+SIDE_MARGIN = 10
+BUBBLE_PADDING_X = 12
+BUBBLE_PADDING_Y = 8
+BUBBLE_RADIUS = 20
+BUBBLE_MAX_WIDTH = 600
+BUBBLE_MIN_WIDTH_CAP = 360
+FONT_PIXEL_SIZE = 16
+
+
+def count_characters(text):
+    chinese_count = 0
+    english_count = 0
+    for char in text:
+        if "\u4e00" <= char <= "\u9fff" or "\u3000" <= char <= "\u303f" or "\uff00" <= char <= "\uffa0":
+            chinese_count += 1
+        elif char.isalpha() and char.isascii():
+            english_count += 1
+    return chinese_count * 2 + english_count
+
+
+def bubble_min_width(text):
+    sizet = count_characters(text)
+    return BUBBLE_MIN_WIDTH_CAP if sizet >= 42 else sizet * 9
+
+
+class ChatMessage:
+    """一条聊天消息，layout_width/text_size/height 是委托缓存的排版结果"""
+    __slots__ = ("text", "is_ai", "created_at", "row", "min_width", "layout_width", "text_size", "height")
+
+    def __init__(self, text, is_ai=True, created_at=None):
+        self.text = text
+        self.is_ai = is_ai
+        self.created_at = created_at if created_at is not None else time.time()
+        self.row = -1
+        self.min_width = bubble_min_width(text)
+        self.layout_width = None
+        self.text_size = None
+        self.height = None
+
+
+class ChatMessageModel(QAbstractListModel):
+    """保存聊天消息记录的列表模型"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self.messages[index.row()]
+        if role == Qt.DisplayRole:
+            return message.text
+        if role == MessageRole:
+            return message
+        return None
+
+    def append_message(self, text, is_ai=True, created_at=None):
+        message = ChatMessage(text, is_ai, created_at)
+        message.row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), message.row, message.row)
+        self.messages.append(message)
+        self.endInsertRows()
+        return message
+
+    def prepend_messages(self, records):
+        """在开头插入一页更早的消息(来自聊天记录库)，返回插入的条数"""
+        if not records:
+            return 0
+        older = [ChatMessage(r["text"], r["is_ai"], r.get("created_at")) for r in records]
+        self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+        self.messages[0:0] = older
+        for row, message in enumerate(self.messages):
+            message.row = row
+        self.endInsertRows()
+        return len(older)
+
+    def append_text(self, message, text):
+        """向已有消息追加文本(流式回复)，只使这一条消息的排版缓存失效"""
+        message.text += text
+        if message.min_width < BUBBLE_MIN_WIDTH_CAP:
+            message.min_width = bubble_min_width(message.text)
+        message.layout_width = None
+        index = self.index(message.row)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        return index
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = []
+        self.endResetModel()
+
+
+class ChatBubbleDelegate(QStyledItemDelegate):
+    """绘制头像和圆角气泡，缓存每条消息的排版尺寸"""
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.font = QFont()
+        self.font.setPixelSize(FONT_PIXEL_SIZE)
+        self.metrics = QFontMetrics(self.font)
+        self.avatar_font = QFont()
+        self.avatar_font.setPixelSize(22)
+
+    def layout_message(self, message, width):
+        """计算(或取缓存的)文字区域大小和行高"""
+        if message.layout_width == width and message.text_size is not None:
+            return message.text_size, message.height
+        available = min(BUBBLE_MAX_WIDTH, width - 2 * SIDE_MARGIN - AVATAR_SIZE - AVATAR_SPACING)
+        available = max(available - 2 * BUBBLE_PADDING_X, 1)
+        bounds = self.metrics.boundingRect(QRect(0, 0, available, 1 << 20), Qt.TextWordWrap, message.text)
+        text_width = min(max(bounds.width(), message.min_width - 2 * BUBBLE_PADDING_X), available)
+        text_height = max(bounds.height(), self.metrics.height())
+        message.layout_width = width
+        message.text_size = QSize(text_width, text_height)
+        message.height = max(AVATAR_SIZE, text_height + 2 * BUBBLE_PADDING_Y) + 2 * ROW_MARGIN
+        return message.text_size, message.height
+
+    def sizeHint(self, option, index):
+        width = self.view.viewport().width()
+        _, height = self.layout_message(index.data(MessageRole), width)
+        return QSize(width, height)
+
+    def refresh(self, index):
+        """追加文本后调用: 行高不变只重绘这一行，行高变化才让视图重新布局"""
+        message = index.data(MessageRole)
+        previous_height = message.height
+        _, height = self.layout_message(message, self.view.viewport().width())
+        if height != previous_height:
+            self.sizeHintChanged.emit(index)
+
+    def paint(self, painter, option, index):
+        message = index.data(MessageRole)
+        rect = option.rect
+        text_size, _ = self.layout_message(message, rect.width())
+        bubble_width = text_size.width() + 2 * BUBBLE_PADDING_X
+        bubble_height = text_size.height() + 2 * BUBBLE_PADDING_Y
+        top = rect.top() + ROW_MARGIN
+
+        if message.is_ai:
+            avatar_rect = QRect(rect.left() + SIDE_MARGIN, top, AVATAR_SIZE, AVATAR_SIZE)
+            bubble_left = avatar_rect.right() + 1 + AVATAR_SPACING
+        else:
+            avatar_rect = QRect(rect.right() - SIDE_MARGIN - AVATAR_SIZE + 1, top, AVATAR_SIZE, AVATAR_SIZE)
+            bubble_left = avatar_rect.left() - AVATAR_SPACING - bubble_width
+        bubble_rect = QRect(bubble_left, top, bubble_width, bubble_height)
+        text_rect = bubble_rect.adjusted(BUBBLE_PADDING_X, BUBBLE_PADDING_Y, -BUBBLE_PADDING_X, -BUBBLE_PADDING_Y)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        painter.setPen(QPen(QColor("#555555"), 2))
+        painter.setBrush(QColor("#FFFFFF"))
+        painter.drawEllipse(avatar_rect.adjusted(1, 1, -1, -1))
+        painter.setFont(self.avatar_font)
+        painter.setPen(QColor("#000000"))
+        painter.drawText(avatar_rect, Qt.AlignCenter, "🤖" if message.is_ai else "😊")
+
+        radius = min(BUBBLE_RADIUS, bubble_height / 2)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(AI_BUBBLE_COLOR if message.is_ai else USER_BUBBLE_COLOR)
+        painter.drawRoundedRect(bubble_rect, radius, radius)
+        painter.setFont(self.font)
+        painter.setPen(QColor("white"))
+        painter.drawText(text_rect, Qt.TextWordWrap | Qt.AlignLeft | Qt.AlignTop, message.text)
+
+        painter.restore()
+
+
+class ChatListView(QListView):
+    """只渲染可见行的聊天记录视图，滚动到顶部时请求加载更早的消息"""
+    olderPageRequested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.message_model = ChatMessageModel(self)
+        self.setModel(self.message_model)
+        self.delegate = ChatBubbleDelegate(self)
+        self.setItemDelegate(self.delegate)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.Adjust)
+        # 大量消息时分批布局，避免一次性计算所有行
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.verticalScrollBar().valueChanged.connect(self.on_scrolled)
+        self.setStyleSheet("""
+            QListView {
+                background-color: transparent;
+                border: none;
+            }
+        """)
+
+    def add_message(self, text, is_ai=True, created_at=None):
+        message = self.message_model.append_message(text, is_ai, created_at)
+        self.scrollToBottom()
+        return message
+
+    def append_text(self, message, text):
+        index = self.message_model.append_text(message, text)
+        self.delegate.refresh(index)
+
+    def on_scrolled(self, value):
+        if value == self.verticalScrollBar().minimum() and self.message_model.messages:
+            self.olderPageRequested.emit()
+
+    def prepend_messages(self, records):
+        """插入更早的一页消息，并保持当前看到的消息位置不动"""
+        had_messages = bool(self.message_model.messages)
+        count = self.message_model.prepend_messages(records)
+        if count and had_messages:
+            self.scrollTo(self.message_model.index(count), QAbstractItemView.PositionAtTop)
+        return count
+
+    def clear(self):
+        self.message_model.clear()
@@ -0,0 +1,201 @@
+#coding=utf-8
+"""本地模拟的llama SSH服务器
+
+用于在没有GPU服务器的情况下测试和压测ssh.py: 基于paramiko ServerInterface在本机监听，
+接受密码登录和交互式shell，收到启动命令后打印提示符">"，之后对每条输入回显，
+再按设定速率逐个输出预设的token序列，最后打印"\\r\\n> "提示符。收到Ctrl-C(\\x03)时中断当前生成。
+
+    python fake_llama_server.py --port 2222 --tokens-per-second 20
+    LLAMA_SSH_HOST=127.0.0.1 LLAMA_SSH_PORT=2222 LLAMA_SSH_USER=llama LLAMA_SSH_PASSWORD=llama python ssh.py
+"""
+import time
+import socket
+import logging
+import argparse
+import threading
+from typing import List, Optional
+
+import paramiko
+
+logger = logging.getLogger("fake_llama_server")
+
+DEFAULT_TOKENS = list("你好！我是一个运行在本地的模拟助手，用于测试对话桥接的延迟和吞吐量。")
+INTERRUPT = b"\x03"
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+        self.shell_requested = threading.Event()
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+
+class FakeLlamaServer:
+    """模拟远端 ./llama 交互进程的SSH服务器"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, username: str = "llama",
+                 password: str = "llama", tokens: Optional[List[str]] = None,
+                 tokens_per_second: float = 20.0, startup_delay: float = 0.0,
+                 prompt_delay: float = 0.0):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.tokens = tokens or DEFAULT_TOKENS
+        self.tokens_per_second = tokens_per_second
+        self.startup_delay = startup_delay
+        # 模拟处理提问(prefill)的耗时，决定首字延迟
+        self.prompt_delay = prompt_delay
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.stopped = threading.Event()
+        self.transports = []
+
+    def start(self) -> "FakeLlamaServer":
+        """在后台线程中开始接受连接"""
+        self.sock.listen(16)
+        threading.Thread(target=self._accept_loop, name="fake-llama-accept", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.sock.listen(16)
+        self._accept_loop()
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for transport in self.transports:
+            transport.close()
+
+    def _accept_loop(self):
+        while not self.stopped.is_set():
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle_connection, args=(client,), daemon=True).start()
+
+    def _handle_connection(self, client):
+        # 逐个token发送，关闭Nagle算法以免小包被攒批延迟
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        server = _ServerInterface(self.username, self.password)
+        try:
+            transport.start_server(server=server)
+        except paramiko.SSHException as e:
+            logger.warning(f"SSH握手失败: {e}")
+            return
+        self.transports.append(transport)
+        while transport.is_active() and not self.stopped.is_set():
+            channel = transport.accept(1)
+            if channel is not None:
+                threading.Thread(target=self._run_shell, args=(channel,), daemon=True).start()
+
+    def _read_line(self, channel, buffer: bytearray) -> Optional[str]:
+        """读取一行输入(模拟终端回显)，通道关闭返回None"""
+        while b"\n" not in buffer and b"\r" not in buffer:
+            data = channel.recv(4096)
+            if not data:
+                return None
+            buffer.extend(data.replace(INTERRUPT, b""))
+        end = min(i for i in (buffer.find(b"\n"), buffer.find(b"\r")) if i != -1)
+        line = bytes(buffer[:end])
+        del buffer[:end + 1]
+        if buffer[:1] == b"\n":
+            del buffer[:1]
+        return line.decode("utf-8", errors="replace")
+
+    def _run_shell(self, channel):
+        buffer = bytearray()
+        try:
+            # 第一行是启动llama的命令
+            command = self._read_line(channel, buffer)
+            if command is None:
+                return
+            channel.sendall(command.encode("utf-8") + b"\r\n")
+            time.sleep(self.startup_delay)
+            channel.sendall("模型加载完成\r\n> ".encode("utf-8"))
+            while True:
+                line = self._read_line(channel, buffer)
+                if line is None:
+                    break
+                channel.sendall(line.encode("utf-8") + b"\r\n")
+                if self._generate(channel, buffer):
+                    channel.sendall(b"^C\r\n")
+                channel.sendall(b"\r\n> ")
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
+
+    def _generate(self, channel, buffer: bytearray) -> bool:
+        """按速率逐个发送token，期间收到Ctrl-C则中断并返回True"""
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        time.sleep(self.prompt_delay)
+        next_at = time.time()
+        for token in self.tokens:
+            if channel.recv_ready():
+                data = channel.recv(4096)
+                if INTERRUPT in data:
+                    return True
+                buffer.extend(data)
+            channel.sendall(token.encode("utf-8"))
+            next_at += interval
+            delay = next_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟的llama SSH服务器')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=2222,
+                        help='监听端口 (默认: 2222)')
+    parser.add_argument('--username', type=str, default='llama',
+                        help='登录用户名 (默认: llama)')
+    parser.add_argument('--password', type=str, default='llama',
+                        help='登录密码 (默认: llama)')
+    parser.add_argument('--tokens-per-second', type=float, default=20.0,
+                        help='每秒输出的token数 (默认: 20)')
+    parser.add_argument('--tokens', type=str, default='',
+                        help='输出的文本，按字符切分为token (默认: 内置中文句子)')
+    parser.add_argument('--startup-delay', type=float, default=0.0,
+                        help='模拟模型加载耗时(秒)')
+    parser.add_argument('--prompt-delay', type=float, default=0.0,
+                        help='模拟处理提问的耗时(秒)，即首字延迟')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = FakeLlamaServer(args.host, args.port, args.username, args.password,
+                             tokens=list(args.tokens) if args.tokens else None,
+                             tokens_per_second=args.tokens_per_second, startup_delay=args.startup_delay,
+                             prompt_delay=args.prompt_delay)
+    print(f"模拟llama服务器已启动: {args.host}:{server.port} (用户 {args.username})")
+    server.serve_forever()
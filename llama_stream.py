@@ -0,0 +1,113 @@
+#coding=utf-8
+"""llama交互输出的流式解析
+
+远端 ./llama 的输出按任意字节边界分块到达。解析器使用增量UTF-8解码器，
+被切开的中文字符会在下一块到达时拼回，而不是被丢弃；回显的输入和结束提示符(">"/"#")
+在块边界上也能正确识别，每个字节只处理一次。
+
+用录制的会话输出回放验证解析结果:
+
+    python llama_stream.py --replay llama_replay
+"""
+import os
+import sys
+import json
+import codecs
+import argparse
+from typing import Iterable, List, Tuple
+
+DEFAULT_SENTINELS = (">", "#")
+
+
+class LlamaStreamParser:
+    """把一次对话的原始输出字节解析为模型回复文本
+
+    feed(data) 返回本次新增的回复文本；检测到结束提示符后 done 为 True，之后的数据被忽略。
+    """
+
+    def __init__(self, skip_echo: bool = True, sentinels: Tuple[str, ...] = DEFAULT_SENTINELS):
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.skip_echo = skip_echo
+        self.sentinels = sentinels
+        self.done = False
+        self.response_chars = 0
+
+    def feed(self, data: bytes) -> str:
+        if self.done:
+            return ""
+        return self._feed_text(self.decoder.decode(data))
+
+    def _feed_text(self, text: str) -> str:
+        if self.skip_echo:
+            # 回显的输入以换行结束，换行之后的内容已经是模型输出
+            newline = text.find("\n")
+            if newline == -1:
+                return ""
+            self.skip_echo = False
+            text = text[newline + 1:]
+        end = len(text)
+        for sentinel in self.sentinels:
+            index = text.find(sentinel, 0, end)
+            if index != -1:
+                end = index
+        if end < len(text):
+            self.done = True
+            text = text[:end]
+        self.response_chars += len(text)
+        return text
+
+    def finish(self) -> str:
+        """输入结束时取出解码器中残留的不完整字符"""
+        if self.done:
+            return ""
+        return self._feed_text(self.decoder.decode(b"", final=True))
+
+
+def parse_chunks(chunks: Iterable[bytes], **kwargs) -> List[str]:
+    """解析一串输出块，返回每次产出的非空文本片段"""
+    parser = LlamaStreamParser(**kwargs)
+    pieces = []
+    for chunk in chunks:
+        piece = parser.feed(chunk)
+        if piece:
+            pieces.append(piece)
+        if parser.done:
+            break
+    else:
+        tail = parser.finish()
+        if tail:
+            pieces.append(tail)
+    return pieces
+
+
+def load_replay(path: str) -> dict:
+    """读取一条录制的会话: {"message", "chunks_hex": [...], "expected"}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        session = json.load(f)
+    session["chunks"] = [bytes.fromhex(chunk) for chunk in session["chunks_hex"]]
+    return session
+
+
+def replay_corpus(directory: str) -> int:
+    """回放目录中的所有会话，返回失败数量"""
+    failures = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        session = load_replay(os.path.join(directory, name))
+        actual = "".join(parse_chunks(session["chunks"]))
+        if actual == session["expected"]:
+            print(f"通过: {name}")
+        else:
+            failures += 1
+            print(f"失败: {name}\n  期望: {session['expected']!r}\n  实际: {actual!r}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='llama输出流解析器')
+    parser.add_argument('--replay', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "llama_replay"),
+                        help='录制会话目录 (默认: llama_replay)')
+    args = parser.parse_args()
+    sys.exit(1 if replay_corpus(args.replay) else 0)
@@ -0,0 +1,271 @@
+#coding=utf-8
+"""常驻的本地对话桥接服务
+
+保持到GPU服务器的SSH连接和已加载模型的llama会话(带keepalive，断线自动重连)，
+widget.py 和其他脚本通过本地socket连接并流式获取回复，SSH握手和模型加载只需付出一次:
+
+    python llm_bridge.py --pool-size 2
+    python widget.py            # connect_to_server() 会自动连接本地桥接服务
+
+协议为逐行JSON: 客户端发送 {"op": "chat", "prompt": ..., "timeout": ...}，
+可选 "deadline" / "idle_timeout" / "max_output_chars" 限制本次回复，
+服务端返回若干 {"chunk": ...}，最后返回 {"done": true, "stats": {...}} 或 {"error": ...}。
+客户端中途断开连接即取消本次对话，远端生成会被中断。
+
+设置环境变量 LLM_BRIDGE_AUTHKEY 后，每个请求都必须带上相同的 "auth" 字段，否则返回 {"error": ...}
+并断开连接；客户端自动从同名环境变量读取。监听非本机回环地址时必须设置该密钥。
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from typing import Any, Dict, Optional
+
+from response_cache import ResponseCache
+from whisper_server import is_loopback
+
+# 随chat请求传递给llama会话的回复限制
+LIMIT_KEYS = ("deadline", "idle_timeout", "max_output_chars")
+
+DEFAULT_BRIDGE_ADDRESS = "127.0.0.1:50008"
+AUTHKEY_ENV = "LLM_BRIDGE_AUTHKEY"
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class BridgeDaemon:
+    """持有SSH连接和llama会话池，断线后自动重连"""
+
+    def __init__(self, address: str = DEFAULT_BRIDGE_ADDRESS, pool_size: Optional[int] = None,
+                 keepalive: int = 30, check_interval: float = 5.0, cache_size: int = 0,
+                 cache_ttl: float = 3600.0, authkey: Optional[str] = None):
+        self.address = parse_address(address)
+        self.authkey = authkey or os.environ.get(AUTHKEY_ENV) or None
+        if not is_loopback(self.address[0]) and not self.authkey:
+            raise ValueError(f"监听非回环地址{self.address[0]}时必须通过环境变量{AUTHKEY_ENV}指定密钥")
+        # 所有客户端共享同一个回复缓存
+        self.cache = ResponseCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.check_interval = check_interval
+        self.ssh_client = None
+        self.pool = None
+        self.ready = threading.Event()
+        self.reconnects = 0
+        self.started_at = time.time()
+
+    def connect(self):
+        """连接服务器，失败时指数退避重试直到成功"""
+        from ssh import create_session_pool
+        delay = 1.0
+        while True:
+            try:
+                self.ssh_client, self.pool = create_session_pool(self.pool_size, keepalive=self.keepalive)
+                self.ready.set()
+                print(f"模型已启动({len(self.pool.sessions)}个会话)", file=sys.stderr)
+                return
+            except Exception as e:
+                print(f"连接服务器失败: {e}，{delay:.0f}秒后重试", file=sys.stderr)
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.check_interval)
+            transport = self.ssh_client.get_transport() if self.ssh_client else None
+            if transport is not None and transport.is_active() and self.pool.sessions:
+                continue
+            print("SSH连接已断开，正在重新连接...", file=sys.stderr)
+            self.ready.clear()
+            self.reconnects += 1
+            try:
+                self.pool.close()
+                self.ssh_client.close()
+            except Exception:
+                pass
+            self.connect()
+
+    def chat(self, prompt: str, timeout: Optional[float] = None, stats: Optional[Dict[str, Any]] = None,
+             **limits):
+        """流式产出回复片段，连接恢复期间等待；stats用于取回本次对话的耗时统计"""
+        if self.cache is not None:
+            return (yield from self.cache.stream(prompt, lambda p: self._chat_uncached(p, timeout, stats, **limits)))
+        return (yield from self._chat_uncached(prompt, timeout, stats, **limits))
+
+    def _chat_uncached(self, prompt: str, timeout: Optional[float], stats: Optional[Dict[str, Any]],
+                       **limits):
+        if not self.ready.wait(timeout):
+            raise TimeoutError("等待服务器连接超时")
+        with self.pool.lease(timeout) as session:
+            response = yield from session.send_message_and_get_response(prompt, **limits)
+            if stats is not None:
+                stats.update(session.last_response_stats)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "connected": self.ready.is_set(),
+            "reconnects": self.reconnects,
+            "pool": self.pool.stats() if self.pool else None,
+            "cache": self.cache.stats() if self.cache else None,
+        }
+
+    def serve_forever(self):
+        self.connect()
+        threading.Thread(target=self._monitor, name="bridge-monitor", daemon=True).start()
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def send(self, payload):
+                self.wfile.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        self.send({"error": "无效的请求"})
+                        continue
+                    if daemon.authkey and not hmac.compare_digest(str(request.get("auth", "")).encode("utf-8"),
+                                                                  daemon.authkey.encode("utf-8")):
+                        self.send({"error": "认证失败"})
+                        return
+                    op = request.get("op")
+                    if op == "ping":
+                        self.send({"pong": True})
+                    elif op == "stats":
+                        self.send(daemon.stats())
+                    elif op == "chat":
+                        self.handle_chat(request)
+                    else:
+                        self.send({"error": f"未知操作: {op}"})
+
+            def handle_chat(self, request):
+                stats = {}
+                limits = {key: request[key] for key in LIMIT_KEYS if request.get(key) is not None}
+                stream = daemon.chat(request.get("prompt", ""), request.get("timeout"), stats, **limits)
+                try:
+                    for chunk in stream:
+                        self.send({"chunk": chunk})
+                    self.send({"done": True, "stats": stats})
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端断开，关闭生成器以便会话在后台恢复
+                    stream.close()
+                except Exception as e:
+                    self.send({"error": str(e)})
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        with socketserver.ThreadingTCPServer(self.address, Handler) as server:
+            print(f"对话桥接服务已启动: {self.address[0]}:{self.address[1]}", file=sys.stderr)
+            server.serve_forever()
+
+
+class BridgeClient:
+    """本地对话桥接服务的客户端"""
+
+    def __init__(self, address: str = DEFAULT_BRIDGE_ADDRESS, connect_timeout: float = 1.0,
+                 authkey: Optional[str] = None):
+        self.address = parse_address(address)
+        self.connect_timeout = connect_timeout
+        self.authkey = authkey or os.environ.get(AUTHKEY_ENV) or None
+        self.last_response_stats = {}
+
+    def _open(self):
+        sock = socket.create_connection(self.address, timeout=self.connect_timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _encode(self, payload) -> bytes:
+        if self.authkey:
+            payload = dict(payload, auth=self.authkey)
+        return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _request(self, payload):
+        with self._open() as sock:
+            sock.sendall(self._encode(payload))
+            with sock.makefile("rb") as reader:
+                return json.loads(reader.readline().decode("utf-8"))
+
+    def ping(self) -> bool:
+        try:
+            return bool(self._request({"op": "ping"}).get("pong"))
+        except (OSError, ValueError):
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request({"op": "stats"})
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, cancel_token=None, **limits):
+        """流式产出回复片段，返回完整回复；cancel_token取消时断开连接，服务端随之中断生成"""
+        sent_at = time.time()
+        self.last_response_stats = {"sent_at": sent_at, "first_token_latency": None}
+        response = ""
+        complete = False
+        request = {"op": "chat", "prompt": prompt, "timeout": timeout}
+        request.update({key: limits[key] for key in LIMIT_KEYS if limits.get(key) is not None})
+        with self._open() as sock:
+            sock.sendall(self._encode(request))
+            if cancel_token is not None:
+                cancel_token.attach(lambda: sock.shutdown(socket.SHUT_RDWR))
+            try:
+                with sock.makefile("rb") as reader:
+                    for line in reader:
+                        message = json.loads(line.decode("utf-8"))
+                        if "chunk" in message:
+                            if self.last_response_stats["first_token_latency"] is None:
+                                self.last_response_stats["first_token_latency"] = time.time() - sent_at
+                            response += message["chunk"]
+                            yield message["chunk"]
+                        elif message.get("done"):
+                            server_stats = message.get("stats") or {}
+                            self.last_response_stats["server"] = server_stats
+                            complete = server_stats.get("complete", True)
+                            break
+                        elif "error" in message:
+                            raise RuntimeError(message["error"])
+            except OSError:
+                if cancel_token is None or not cancel_token.cancelled:
+                    raise
+            finally:
+                if cancel_token is not None:
+                    cancel_token.detach()
+        if cancel_token is not None and cancel_token.cancelled and not complete:
+            self.last_response_stats["stop_reason"] = "cancelled"
+        self.last_response_stats["total_time"] = time.time() - sent_at
+        self.last_response_stats["chars"] = len(response)
+        return response if complete else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='常驻的本地对话桥接服务')
+    parser.add_argument('--address', type=str, default=DEFAULT_BRIDGE_ADDRESS,
+                        help=f'监听地址 (默认: {DEFAULT_BRIDGE_ADDRESS})')
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help='llama会话数量 (默认: 环境变量LLAMA_POOL_SIZE或1)')
+    parser.add_argument('--keepalive', type=int, default=30,
+                        help='SSH keepalive间隔(秒) (默认: 30)')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='回复缓存条数，0表示不缓存 (默认: 0)')
+    parser.add_argument('--cache-ttl', type=float, default=3600.0,
+                        help='回复缓存过期时间(秒) (默认: 3600)')
+    args = parser.parse_args()
+
+    try:
+        daemon = BridgeDaemon(args.address, args.pool_size, args.keepalive,
+                              cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    except ValueError as e:
+        parser.error(str(e))
+    daemon.serve_forever()
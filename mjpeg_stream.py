@@ -0,0 +1,74 @@
+#coding=utf-8
+"""MJPEG视频流读取
+
+只依赖OpenCV解码JPEG，不导入TensorFlow/DeepFace等情绪识别依赖，
+聊天界面的摄像头预览和 ubuntu_emotion_client1 共用。
+"""
+import socket
+import urllib.request
+
+import cv2
+import numpy as np
+
+
+class MJPEGStreamReader:
+    def __init__(self, url):
+        self.url = url
+        self.stream = None
+        self.bytes = b''
+        self.closed = False
+        self.connect()
+
+    def connect(self):
+        try:
+            self.stream = urllib.request.urlopen(self.url)
+            print(f"成功连接到视频流: {self.url}")
+        except Exception as e:
+            print(f"连接视频流失败: {str(e)}")
+            self.stream = None
+
+    def close(self):
+        """断开视频流，可以在其他线程调用以唤醒阻塞在read_frame中的读取；关闭后不再重连"""
+        self.closed = True
+        stream = self.stream
+        if stream is None:
+            return
+        # 另一个线程阻塞在read()时直接close()会等待缓冲区的锁，先关闭socket让read()返回
+        sock = getattr(getattr(stream.fp, "raw", None), "_sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            stream.close()
+        except Exception:
+            pass
+
+    def read_frame(self):
+        if self.closed:
+            return False, None
+        if self.stream is None:
+            try:
+                self.connect()
+                if self.stream is None:
+                    return False, None
+            except:
+                return False, None
+        try:
+            while True:
+                chunk = self.stream.read(1024)
+                if not chunk:
+                    raise ConnectionError("视频流已断开")
+                self.bytes += chunk
+                a = self.bytes.find(b'\xff\xd8')
+                b = self.bytes.find(b'\xff\xd9')
+                if a != -1 and b != -1:
+                    jpg = self.bytes[a:b+2]
+                    self.bytes = self.bytes[b+2:]
+                    return True, cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except Exception as e:
+            if not self.closed:
+                print(f"读取视频帧错误: {str(e)}")
+            self.stream = None
+            return False, None
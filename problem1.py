@@ -1,38 +1,27 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Precompute factorials
-lx = [1] * 250
-for i in range(1, 250):
-    lx[i] = lx[i-1] * i
+from sampling_plan import compute_boundaries
 
-def C(n, k):
-    return lx[n] // lx[k] // lx[n - k] if k <= n else 0
-
-# Initialize results arrays
-results1 = [(250, 0)] * 250
-results2 = [(0, 0)] * 250
+# Sample sizes n = 1..N_MAX-1, defective counts k = 0..K_MAX-1
+N_MAX = 250
+K_MAX = 30
 
 p0 = 0.1
 p1 = 0.05
 p2 = 0.1
 
-# Calculate results
-for i in range(1, 250):
-    sump = 0.0
-    for j in range(0, min(i, 30)):
-        sump += C(i, j) * (p0 ** j) * ((1 - p0) ** (i - j))
-        if sump >= 1 - p1:
-            results1[j] = (i, 1 - sump)
-        if sump <= p2 and results2[j][0] == 0:
-            results2[j] = (i, sump)
+# Calculate results (vectorized log-space binomial CDF, see sampling_plan.py)
+boundaries = compute_boundaries(p0, alpha=p1, beta=p2, n_max=N_MAX, k_max=K_MAX)
+results1 = list(zip(boundaries["reject_n"].tolist(), boundaries["reject_tail"].tolist()))
+results2 = list(zip(boundaries["accept_n"].tolist(), boundaries["accept_cdf"].tolist()))
 
 # Extract x and y values for plotting
 x1 = [0, 0]
-for i in range(30):
-    if results1[i][0] < 250: x1.append(results1[i][0])
+for i in range(K_MAX):
+    if results1[i][0] < N_MAX: x1.append(results1[i][0])
 y1 = list(range(len(x1)))
-x2 = [results2[j][0] for j in range(30) if results2[j][0] > 0]
+x2 = [results2[j][0] for j in range(K_MAX) if results2[j][0] > 0]
 y2 = list(range(len(x2)))
 
 # Truncate to the shortest common length
@@ -50,7 +39,7 @@ plt.plot(x1, y1, 'b-', label='p > 0.1,Confidence = 90%')
 plt.plot(x2, y2, 'r-', label='p < 0.1,Confidence = 90%')
 
 # Shade regions
-plt.fill_betweenx(y1, x1, 250, color='red', alpha=0.2, label='Rejection region')
+plt.fill_betweenx(y1, x1, N_MAX, color='red', alpha=0.2, label='Rejection region')
 plt.fill_betweenx(y2, 0, x2, color='green', alpha=0.2, label='Acceptance region')
 plt.fill_betweenx(y1, x2, x1, color='yellow', alpha=0.1, label='Pending region')
 
@@ -65,7 +54,7 @@ for idx in points_to_mark:
         plt.text(x2[idx] + 5, y2[idx], f'({x2[idx]}, {y2[idx]})', fontsize=8)
 
 # Set axis limits and labels
-plt.xlim(0, 250)
+plt.xlim(0, N_MAX)
 plt.ylim(0, min_length)
 plt.xlabel('Sample Size (n)')
 plt.ylabel('Number of defective products (k)')
@@ -0,0 +1,102 @@
+#coding=utf-8
+"""对话回复缓存
+
+问候语、常见问题等相同或几乎相同的提问直接重放缓存的回复，不再走一次完整的7B推理。
+提问先做归一化(全角转半角、去掉空白和标点、英文小写)，缓存按条数做LRU淘汰并带过期时间，
+命中时按原来的分块形式流式重放，调用方看到的生成器形状与 send_message_and_get_response 一致。
+"""
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+def normalize_prompt(prompt: str) -> str:
+    """NFKC归一化(全角转半角)，去掉空白和标点，英文转小写"""
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    return "".join(c for c in text if not c.isspace() and not unicodedata.category(c).startswith("P"))
+
+
+class ResponseCache:
+    """按归一化提问缓存回复分块的LRU缓存"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, prompt: str) -> Optional[List[str]]:
+        key = normalize_prompt(prompt)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, prompt: str, chunks: List[str]):
+        key = normalize_prompt(prompt)
+        if not key:
+            return
+        with self.lock:
+            self.entries[key] = (list(chunks), time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stream(self, prompt: str, generate: Callable[[str], Iterator[str]]):
+        """命中时重放缓存分块，否则调用generate(prompt)并在完整结束后写入缓存"""
+        chunks = self.get(prompt)
+        if chunks is not None:
+            for chunk in chunks:
+                yield chunk
+            return "".join(chunks)
+
+        chunks = []
+        generator = generate(prompt)
+        try:
+            while True:
+                try:
+                    chunk = next(generator)
+                except StopIteration as stop:
+                    response = stop.value
+                    break
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            generator.close()
+        # 出错(返回None)或没有输出的回复不缓存
+        if response is not None and chunks:
+            self.put(prompt, chunks)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,155 @@
+#coding=utf-8
+"""抽样检验方案的接收/拒收边界计算
+
+对样本量n和不合格品数k，X~B(n, p0)，累积概率 P(X<=k) 在对数空间中按整块矩阵计算:
+    log C(n, k) = logfact[n] - logfact[k] - logfact[n-k]   (logfact[n] = lgamma(n+1)，由log(1..n)累加得到)
+    log P(X<=k) = logaddexp.accumulate(log pmf, 沿k方向)    (累积log-sum-exp)
+不再需要大整数阶乘和二重Python循环，n可以取到几万；按n分块计算，内存占用与n的上限无关。
+原来的大整数逐项累加保留在 reference_boundaries 中，`--check` 用它核对分块计算的结果。
+
+边界的定义与 problem1.py 原来的逐项累加一致(只考虑 k < n 的项):
+    拒收边界 reject_n[k]: P(X<=k) >= 1 - alpha 的最大n，对应的尾概率 1 - P(X<=k)；不存在时为 n_max
+    接收边界 accept_n[k]: P(X<=k) <= beta 的最小n，对应的累积概率 P(X<=k)；不存在时为 0
+"""
+import sys
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 4096
+# --check 使用的参数组合 (p0, alpha, beta, n_max, k_max)
+CHECK_CASES = [
+    (0.1, 0.05, 0.1, 250, 30),
+    (0.05, 0.05, 0.1, 250, 30),
+    (0.2, 0.1, 0.05, 250, 30),
+    (0.1, 0.05, 0.1, 160, 30),
+    (0.1, 0.05, 0.1, 20, 30),
+]
+
+
+def log_factorials(n_max: int) -> np.ndarray:
+    """logfact[n] = log(n!)，n = 0..n_max"""
+    logfact = np.zeros(n_max + 1)
+    np.cumsum(np.log(np.arange(1, n_max + 1, dtype=np.float64)), out=logfact[1:])
+    return logfact
+
+
+def log_binom_cdf(n: np.ndarray, k_max: int, p: float, logfact: np.ndarray) -> np.ndarray:
+    """返回形状为 (len(n), k_max) 的 log P(X<=k)，k = 0..k_max-1；k > n 的位置为 -inf(不参与累积)"""
+    n = np.asarray(n, dtype=np.int64)[:, None]
+    k = np.arange(k_max, dtype=np.int64)[None, :]
+    valid = k <= n
+    n_minus_k = np.where(valid, n - k, 0)
+    log_pmf = (logfact[n] - logfact[k] - logfact[n_minus_k]
+               + k * np.log(p) + n_minus_k * np.log1p(-p))
+    log_pmf = np.where(valid, log_pmf, -np.inf)
+    return np.logaddexp.accumulate(log_pmf, axis=1)
+
+
+def compute_boundaries(p0: float = 0.1, alpha: float = 0.05, beta: float = 0.1,
+                       n_max: int = 250, k_max: int = 30,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """计算 n = 1..n_max-1、k = 0..k_max-1 范围内的拒收和接收边界"""
+    for name, value in (("p0", p0), ("alpha", alpha), ("beta", beta)):
+        if not 0 < value < 1:
+            raise ValueError(f"{name}必须在0和1之间(不含端点)，当前为{value}")
+    if n_max < 1 or k_max < 1 or chunk_size < 1:
+        raise ValueError("n_max、k_max和chunk_size必须是正整数")
+    reject_n = np.full(k_max, n_max, dtype=np.int64)
+    reject_tail = np.zeros(k_max)
+    accept_n = np.zeros(k_max, dtype=np.int64)
+    accept_cdf = np.zeros(k_max)
+    # 下标同时用到n(< n_max)和k(< k_max)
+    logfact = log_factorials(max(n_max, k_max))
+    log_reject = np.log1p(-alpha)
+    log_accept = np.log(beta)
+    k = np.arange(k_max)
+
+    for start in range(1, n_max, chunk_size):
+        n = np.arange(start, min(start + chunk_size, n_max))
+        log_cdf = log_binom_cdf(n, k_max, p0, logfact)
+        evaluated = k[None, :] < n[:, None]
+
+        # 拒收边界取满足条件的最大n，后面的块覆盖前面的
+        hit = evaluated & (log_cdf >= log_reject)
+        found = hit.any(axis=0)
+        last = len(n) - 1 - np.argmax(hit[::-1], axis=0)
+        reject_n[found] = n[last[found]]
+        reject_tail[found] = -np.expm1(log_cdf[last[found], k[found]])
+
+        # 接收边界取满足条件的最小n，只填还没有找到的k
+        hit = evaluated & (log_cdf <= log_accept)
+        found = hit.any(axis=0) & (accept_n == 0)
+        first = np.argmax(hit, axis=0)
+        accept_n[found] = n[first[found]]
+        accept_cdf[found] = np.exp(log_cdf[first[found], k[found]])
+
+    return {
+        "reject_n": reject_n,
+        "reject_tail": reject_tail,
+        "accept_n": accept_n,
+        "accept_cdf": accept_cdf,
+    }
+
+
+def reference_boundaries(p0: float, alpha: float, beta: float,
+                         n_max: int, k_max: int) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+    """problem1.py 原来的大整数阶乘逐项累加，返回 (拒收边界, 接收边界)，每项为 (n, 概率)"""
+    size = max(n_max, k_max)
+    fact = [1] * size
+    for i in range(1, size):
+        fact[i] = fact[i - 1] * i
+    reject = [(n_max, 0.0)] * k_max
+    accept = [(0, 0.0)] * k_max
+    for n in range(1, n_max):
+        s = 0.0
+        for k in range(0, min(n, k_max)):
+            s += fact[n] // fact[k] // fact[n - k] * (p0 ** k) * ((1 - p0) ** (n - k))
+            if s >= 1 - alpha:
+                reject[k] = (n, 1 - s)
+            if s <= beta and accept[k][0] == 0:
+                accept[k] = (n, s)
+    return reject, accept
+
+
+def check(chunk_sizes=(DEFAULT_CHUNK_SIZE, 7), rtol: float = 1e-9, atol: float = 1e-12) -> bool:
+    """用 CHECK_CASES 逐项核对分块计算与大整数基线：n必须完全相同，概率在rtol/atol内一致
+
+    基线的尾概率是 1 - s，很小的尾概率只有约1e-16的绝对精度，所以比较时带上atol。
+    """
+    ok = True
+    for p0, alpha, beta, n_max, k_max in CHECK_CASES:
+        reject, accept = reference_boundaries(p0, alpha, beta, n_max, k_max)
+        for chunk_size in chunk_sizes:
+            b = compute_boundaries(p0, alpha, beta, n_max, k_max, chunk_size)
+            same = (np.array_equal(b["reject_n"], [n for n, _ in reject])
+                    and np.array_equal(b["accept_n"], [n for n, _ in accept])
+                    and np.allclose(b["reject_tail"], [v for _, v in reject], rtol=rtol, atol=atol)
+                    and np.allclose(b["accept_cdf"], [v for _, v in accept], rtol=rtol, atol=atol))
+            ok = ok and same
+            print(f"p0={p0} alpha={alpha} beta={beta} n_max={n_max} k_max={k_max} "
+                  f"chunk_size={chunk_size}: {'一致' if same else '不一致'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='抽样检验方案的接收/拒收边界')
+    parser.add_argument('--p0', type=float, default=0.1, help='标称不合格率 (默认: 0.1)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='拒收边界的显著性水平 (默认: 0.05)')
+    parser.add_argument('--beta', type=float, default=0.1, help='接收边界的显著性水平 (默认: 0.1)')
+    parser.add_argument('--n-max', type=int, default=250, help='样本量上限(不含) (默认: 250)')
+    parser.add_argument('--k-max', type=int, default=30, help='不合格品数上限(不含) (默认: 30)')
+    parser.add_argument('--check', action='store_true', help='与原来的大整数逐项累加结果逐项核对')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check() else 1)
+    try:
+        boundaries = compute_boundaries(args.p0, args.alpha, args.beta, args.n_max, args.k_max)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{'k':>5}{'拒收n':>10}{'尾概率':>14}{'接收n':>10}{'累积概率':>14}")
+    for k in range(args.k_max):
+        print(f"{k:>5}{boundaries['reject_n'][k]:>10}{boundaries['reject_tail'][k]:>14.6g}"
+              f"{boundaries['accept_n'][k]:>10}{boundaries['accept_cdf'][k]:>14.6g}")
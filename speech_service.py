@@ -1,32 +1,161 @@
 import os
 import time
+import atexit
 import logging
-import tempfile
 import json
-import subprocess
 import datetime
 from typing import Dict, Any, Optional, List
 import uuid
-import pyttsx3
+import threading
 import whisper
 import speech_recognition as sr
+import numpy as np
+from audio_io import WHISPER_SAMPLE_RATE, decode_audio_bytes, load_audio_file
+from tts_cache import TTSCache
+from transcript_store import TranscriptStore
+from tts_worker import SentenceStreamer, TTSHandle, TTSWorker, apply_tts_settings
+
+DEFAULT_WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "small")
+
+# 进程内共享的Whisper模型缓存，同一进程中的多个SpeechService实例复用同一份模型
+_whisper_models: Dict[str, Any] = {}
+_whisper_models_lock = threading.Lock()
+# Whisper模型不能被多个线程同时调用，每个共享模型配一把推理锁
+_whisper_inference_locks: Dict[str, threading.Lock] = {}
+# 每种模型大小各一把加载锁，加载期间不占用保护字典的全局锁
+_whisper_load_locks: Dict[str, threading.Lock] = {}
+
+
+def get_whisper_inference_lock(model_size: str) -> threading.Lock:
+    """返回指定共享模型的推理锁"""
+    with _whisper_models_lock:
+        return _whisper_inference_locks.setdefault(model_size, threading.Lock())
+
+
+def load_shared_whisper_model(model_size: str = DEFAULT_WHISPER_MODEL_SIZE):
+    """加载(或复用已加载的)指定大小的Whisper模型"""
+    with _whisper_models_lock:
+        model = _whisper_models.get(model_size)
+        if model is not None:
+            return model
+        load_lock = _whisper_load_locks.setdefault(model_size, threading.Lock())
+    # 同一大小的模型只由一个线程加载，其他线程等待后直接复用
+    with load_lock:
+        with _whisper_models_lock:
+            model = _whisper_models.get(model_size)
+        if model is None:
+            logger = logging.getLogger("speech_service")
+            logger.info(f"正在加载Whisper模型({model_size})...")
+            start_time = time.time()
+            model = whisper.load_model(model_size)
+            with _whisper_models_lock:
+                _whisper_models[model_size] = model
+            logger.info(
+                f"Whisper模型({model_size})加载完成，耗时{time.time() - start_time:.1f}秒，"
+                f"{format_memory_usage(model)}"
+            )
+        return model
+
+
+def preload_whisper_model(model_size: str = DEFAULT_WHISPER_MODEL_SIZE) -> threading.Thread:
+    """在后台线程中预加载Whisper模型，避免首次识别时等待"""
+    def _preload():
+        try:
+            load_shared_whisper_model(model_size)
+        except Exception as e:
+            logging.getLogger("speech_service").error(f"预加载Whisper模型失败: {e}")
+
+    thread = threading.Thread(target=_preload, name=f"whisper-preload-{model_size}", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_process_rss_mb() -> float:
+    """返回当前进程的常驻内存(MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        # ru_maxrss 在Linux上单位为KB，在macOS上为字节，这里只作为峰值近似
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def get_model_memory_mb(model) -> float:
+    """估算模型参数和缓冲区占用的内存(MB)"""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return total / (1024 * 1024)
+    except AttributeError:
+        return 0.0
+
+
+def format_memory_usage(model=None) -> str:
+    """格式化内存占用信息用于日志"""
+    text = f"进程内存: {get_process_rss_mb():.0f}MB"
+    if model is not None:
+        text += f", 模型参数: {get_model_memory_mb(model):.0f}MB"
+    return text
+
 
 class SpeechService:
     """语音服务核心类，提供语音转文字和文字转语音功能"""
     
-    def __init__(self):
+    def __init__(self, model_size: Optional[str] = None, preload: bool = True,
+                 model_server: Optional[str] = None, tts_cache_mb: int = 200):
+        """
+        model_size: Whisper模型大小(tiny/base/small/medium/large)，默认读取环境变量WHISPER_MODEL_SIZE
+        preload: 是否在后台线程中预加载模型
+        model_server: 共享模型服务地址(host:port)，设置后通过whisper_server识别，
+                      默认读取环境变量WHISPER_SERVER
+        tts_cache_mb: TTS音频缓存的大小上限(MB)，超出后按LRU删除
+        """
         # 初始化日志
         self._setup_logging()
         
         # 初始化模型和引擎
+        self.model_size = model_size or DEFAULT_WHISPER_MODEL_SIZE
+        self.model_server = model_server or os.environ.get("WHISPER_SERVER")
         self.whisper_model = None
-        self.tts_engine = pyttsx3.init()
+        self.inference_lock = get_whisper_inference_lock(self.model_size)
+        if preload and not self.model_server:
+            preload_whisper_model(self.model_size)
         
         # 创建文件存储目录
         self.audio_files_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "audio_files")
         self.json_files_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "json_files")
         os.makedirs(self.audio_files_dir, exist_ok=True)
         os.makedirs(self.json_files_dir, exist_ok=True)
+        self.transcript_store = TranscriptStore(os.path.join(self.json_files_dir, "transcripts.db"))
+        self.tts_cache = TTSCache(self.audio_files_dir, max_bytes=tts_cache_mb * 1024 * 1024)
+        # pyttsx3引擎不是线程安全的，由TTS工作线程独占
+        self.tts_worker = TTSWorker(self.tts_cache)
+        # 最近一次实时识别的时间点(speech_end/stt_result)，在回调之前更新，供延迟追踪使用
+        self.last_recognition_timing = {}
+        self.closed = False
+        atexit.register(self.close)
+
+    def close(self):
+        """写入尚未保存的识别结果并停止TTS工作线程，可以重复调用"""
+        if self.closed:
+            return
+        self.closed = True
+        self.transcript_store.close()
+        self.tts_worker.stop()
+        if self.model_server and self.whisper_model is not None:
+            # 共享模型服务的客户端连接
+            self.whisper_model.close()
 
     def _setup_logging(self):
         """配置日志系统"""
@@ -37,156 +166,136 @@ class SpeechService:
         self.logger = logging.getLogger("speech_service")
 
     def get_whisper_model(self):
-        """延迟加载Whisper模型"""
+        """获取Whisper模型：优先使用共享模型服务，否则使用进程内共享模型"""
         if self.whisper_model is None:
             try:
-                self.logger.info("正在加载Whisper模型...")
-                self.whisper_model = whisper.load_model("small")
-                self.logger.info("Whisper模型加载完成")
+                if self.model_server:
+                    from whisper_server import WhisperClient
+                    self.whisper_model = WhisperClient(self.model_server)
+                    self.logger.info(f"使用共享Whisper模型服务: {self.model_server}")
+                else:
+                    self.whisper_model = load_shared_whisper_model(self.model_size)
             except Exception as e:
                 self.logger.error(f"加载Whisper模型失败: {e}")
                 raise RuntimeError(f"无法加载语音识别模型: {e}")
         return self.whisper_model
 
-    def convert_to_whisper_format(self, input_path: str, output_path: Optional[str] = None) -> str:
-        """转换音频格式为Whisper推荐格式(16kHz, mono, wav)"""
-        if output_path is None:
-            output_path = input_path.replace('.wav', '_converted.wav')
-
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"找不到音频文件: {input_path}")
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """报告当前进程和Whisper模型的内存占用"""
+        info = {
+            "model_size": self.model_size,
+            "model_server": self.model_server,
+            "process_rss_mb": round(get_process_rss_mb(), 1),
+            "model_loaded": self.whisper_model is not None or self.model_size in _whisper_models,
+        }
+        if self.model_server:
+            if self.whisper_model is not None:
+                info["server"] = self.whisper_model.info()
+        elif self.model_size in _whisper_models:
+            info["model_memory_mb"] = round(get_model_memory_mb(_whisper_models[self.model_size]), 1)
+        return info
 
-        command = [
-            'ffmpeg', '-y',
-            '-i', input_path,
-            '-ar', '16000',
-            '-ac', '1',
-            '-f', 'wav',
-            output_path
-        ]
-
-        try:
-            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"音频转换失败: {e}")
-        return output_path
+    def transcribe_audio(self, audio: np.ndarray) -> Dict[str, Any]:
+        """识别16kHz单声道float32音频数组"""
+        model = self.get_whisper_model()
+        with self.inference_lock:
+            result = model.transcribe(audio, language='zh')
+        recognized_text = result["text"]
+        self.logger.info(f"语音识别结果: {recognized_text}")
+        return {
+            "text": recognized_text,
+            "success": True
+        }
 
     def process_speech(self, audio_path: str) -> Dict[str, Any]:
         """处理语音并返回识别文本"""
         try:
-            model = self.get_whisper_model()
-            converted_path = self.convert_to_whisper_format(audio_path)
-            result = model.transcribe(converted_path, language='zh')
-            recognized_text = result["text"]
-            self.logger.info(f"语音识别结果: {recognized_text}")
-
-            try:
-                if os.path.exists(converted_path) and converted_path != audio_path:
-                    os.unlink(converted_path)
-            except Exception as e:
-                self.logger.warning(f"删除转换后的音频文件失败: {str(e)}")
-
-            return {
-                "text": recognized_text,
-                "success": True
-            }
-                
+            audio = load_audio_file(audio_path)
+            return self.transcribe_audio(audio)
         except Exception as e:
             self.logger.error(f"语音识别错误: {str(e)}")
             raise RuntimeError(f"语音识别错误: {str(e)}")
 
+    def transcribe_many(self, paths: List[str], workers: Optional[int] = None):
+        """并行批量转写音频文件，每个工作进程持有自己的模型，按完成顺序逐条返回结果"""
+        from batch_transcribe import transcribe_many
+        return transcribe_many(paths, workers=workers, model_size=self.model_size)
+
     def speech_to_text(self, audio_data: bytes) -> Dict[str, Any]:
-        """语音转文本主函数"""
+        """语音转文本主函数，WAV/PCM在内存中解码，不写临时文件"""
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
-                tmp.write(audio_data)
-                tmp_path = tmp.name
-            
-            self.logger.info("临时音频文件已保存，开始进行语音识别")
-            
-            try:
-                result = self.process_speech(tmp_path)
-                timestamp = int(time.time())
-                json_filename = f"stt_{timestamp}.json"
-                json_filepath = os.path.join(self.json_files_dir, json_filename)
-                
-                json_data = {
-                    "text": result["text"],
-                }
-                
-                with open(json_filepath, 'w', encoding='utf-8') as json_file:
-                    json.dump(json_data, json_file, ensure_ascii=False, indent=4)
-                    
-                self.logger.info(f"语音识别结果已保存到JSON文件: {json_filepath}")
-                
-                return result
-            finally:
-                if os.path.exists(tmp_path):
-                    try:
-                        os.unlink(tmp_path)
-                    except Exception as e:
-                        self.logger.warning(f"删除临时文件失败: {str(e)}")
+            start_time = time.time()
+            audio = decode_audio_bytes(audio_data)
+            result = self.transcribe_audio(audio)
+
+            duration = len(audio) / WHISPER_SAMPLE_RATE
+            latency = time.time() - start_time
+            self.transcript_store.append(result["text"], duration=round(duration, 3),
+                                         latency=round(latency, 3), created_at=start_time,
+                                         source="speech_to_text")
+            self.logger.info(f"语音识别结果已提交到识别记录库(时长{duration:.1f}秒，耗时{latency:.2f}秒)")
+
+            return result
         except Exception as e:
             self.logger.error(f"语音识别错误: {str(e)}")
             raise RuntimeError(f"语音识别错误: {str(e)}")
 
-    def text_to_speech(self, text: str, rate: Optional[int] = 200, voice: Optional[str] = None) -> Dict[str, Any]:
-        """文本转语音主函数"""
+    def query_transcripts(self, start: Optional[float] = None, end: Optional[float] = None,
+                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按时间范围(Unix时间戳)查询识别记录"""
+        self.transcript_store.flush()
+        return self.transcript_store.query(start, end, limit)
+
+    def text_to_speech_async(self, text: str, rate: Optional[int] = 200, voice: Optional[str] = None,
+                             play: bool = True) -> TTSHandle:
+        """非阻塞文本转语音：按句切分后流水线合成播放，立即返回句柄(handle.future / handle.result())"""
+        text = text.strip()
+        if not text:
+            raise ValueError("文本不能为空")
+        return self.tts_worker.speak(text, rate, voice, play=play, split=True)
+
+    def speak_stream(self, rate: Optional[int] = 200, voice: Optional[str] = None) -> SentenceStreamer:
+        """边生成边朗读：把流式回复的片段传给返回对象的feed()，结束时调用close()"""
+        return SentenceStreamer(self.tts_worker, rate, voice)
+
+    def text_to_speech(self, text: str, rate: Optional[int] = 200, voice: Optional[str] = None,
+                       play: bool = True) -> Dict[str, Any]:
+        """文本转语音主函数，相同(文本, 语速, 音色)的音频直接从缓存返回"""
         try:
             text = text.strip()
             if not text:
                 raise ValueError("文本不能为空")
-            
-            if rate is not None:
-                self.tts_engine.setProperty('rate', rate)
-                self.logger.info(f"设置语速为: {rate}")
-            
-            if voice is not None:
-                voices = self.tts_engine.getProperty('voices')
-                for v in voices:
-                    if voice in v.id or voice in v.name:
-                        self.tts_engine.setProperty('voice', v.id)
-                        self.logger.info(f"设置音色为: {v.name} (ID: {v.id})")
-                        break
-            
-            timestamp = int(time.time())
-            audio_filename = f"tts_{timestamp}.mp3"
-            audio_filepath = os.path.join(self.audio_files_dir, audio_filename)
-            
-            self.tts_engine.save_to_file(text, audio_filepath)
-            self.tts_engine.say(text)
-            self.tts_engine.runAndWait()
-            
-            self.logger.info(f"文本已转换为语音并保存到: {audio_filepath}")
-            
-            current_rate = self.tts_engine.getProperty('rate')
-            current_voice = self.tts_engine.getProperty('voice')
-            voice_name = "默认"
-            voices = self.tts_engine.getProperty('voices')
-            for v in voices:
-                if v.id == current_voice:
-                    voice_name = v.name
-                    break
-            
-            return {
-                "success": True, 
-                "message": "文本已转换为语音并播放",
-                "audio_file": audio_filename,
-                "audio_path": audio_filepath,
-                "rate": current_rate,
-                "voice": voice_name
-            }
+
+            result = self.tts_worker.speak(text, rate, voice, play=play, split=False).result()
+            self.logger.info(
+                f"{'命中语音缓存' if result['cached'] else '文本已转换为语音并保存到'}: {result['audio_path']}"
+            )
+            return result
         except Exception as e:
             self.logger.error(f"文本转语音错误: {str(e)}")
             raise RuntimeError(f"文本转语音错误: {str(e)}")
 
+    def prewarm_tts(self, phrases: List[str], rate: Optional[int] = 200, voice: Optional[str] = None) -> int:
+        """预先合成常用短语(问候语、确认语等)到缓存，返回新合成的数量"""
+        def _prewarm(engine):
+            current_rate, current_voice = apply_tts_settings(engine, rate, voice)
+
+            def _synthesize_many(targets):
+                for text, path in targets.items():
+                    engine.save_to_file(text, path)
+                engine.runAndWait()
+
+            return self.tts_cache.prewarm(phrases, current_rate, current_voice, _synthesize_many)
+
+        count = self.tts_worker.call(_prewarm).result()
+        self.logger.info(f"语音缓存预热完成，新合成{count}条，{self.tts_cache.stats()}")
+        return count
+
     def get_available_voices(self) -> Dict[str, Any]:
         """获取系统可用的所有语音音色"""
-        try:
-            voices = self.tts_engine.getProperty('voices')
+        def _voices(engine):
             voice_list = []
-            
-            for voice in voices:
+            for voice in engine.getProperty('voices'):
                 voice_list.append({
                     "id": voice.id,
                     "name": voice.name,
@@ -194,26 +303,41 @@ class SpeechService:
                     "gender": getattr(voice, 'gender', 'unknown'),
                     "age": getattr(voice, 'age', 'unknown')
                 })
-            
             return {
                 "success": True,
                 "voices": voice_list,
-                "current_voice": self.tts_engine.getProperty('voice'),
-                "current_rate": self.tts_engine.getProperty('rate')
+                "current_voice": engine.getProperty('voice'),
+                "current_rate": engine.getProperty('rate')
             }
+
+        try:
+            return self.tts_worker.call(_voices).result()
         except Exception as e:
             self.logger.error(f"获取音色列表错误: {str(e)}")
             raise RuntimeError(f"获取音色列表错误: {str(e)}")
 
-    def real_time_speech_to_text(self, callback, stop_event):
-        """实时语音识别"""
+    def real_time_speech_to_text(self, callback, stop_event, mode: str = "google",
+                                 partial_callback=None, audio_path: Optional[str] = None):
+        """实时语音识别
+
+        mode="google": 使用speech_recognition整句识别(需要联网)
+        mode="local": 使用本地Whisper流式识别，partial_callback接收说话过程中的中间结果，
+                      audio_path不为空时用音频文件代替麦克风
+        """
+        if mode == "local":
+            self.local_streaming_speech_to_text(callback, stop_event, partial_callback, audio_path)
+            return
+
         recognizer = sr.Recognizer()
         with sr.Microphone() as source:
             print("正在监听...")
             while not stop_event.is_set():
                 try:
                     audio = recognizer.listen(source, timeout=1)
+                    # listen在检测到pause_threshold秒静音后才返回
+                    speech_end = time.time() - recognizer.pause_threshold
                     text = recognizer.recognize_google(audio, language='zh-CN')
+                    self.last_recognition_timing = {"speech_end": speech_end, "stt_result": time.time()}
                     callback(text)
                 except sr.WaitTimeoutError:
                     pass  # 停顿时继续监听
@@ -222,14 +346,37 @@ class SpeechService:
                 except sr.RequestError as e:
                     print(f"请求错误: {e}")
 
+    def local_streaming_speech_to_text(self, callback, stop_event, partial_callback=None,
+                                       audio_path: Optional[str] = None):
+        """离线流式语音识别：VAD切分语音段，中间结果交给partial_callback，最终结果交给callback"""
+        from streaming_stt import StreamingTranscriber, file_chunks, microphone_chunks, whisper_transcriber
+
+        def _on_result(text, is_final):
+            if is_final:
+                self.last_recognition_timing = {"speech_end": transcriber.last_speech_end_at,
+                                                "stt_result": time.time()}
+                self.transcript_store.append(text, source="streaming")
+                callback(text)
+            elif partial_callback is not None:
+                partial_callback(text)
+
+        transcriber = StreamingTranscriber(
+            whisper_transcriber(self.get_whisper_model(), lock=self.inference_lock), _on_result)
+        chunks = file_chunks(audio_path) if audio_path else microphone_chunks(stop_event)
+        print("正在监听...")
+        transcriber.run(chunks, stop_event)
+
 if __name__ == "__main__":
     speech_service = SpeechService()
-    voices_info = speech_service.get_available_voices()
-    print(json.dumps(voices_info, indent=2, ensure_ascii=False))
-    print("\n文本转语音测试:")
-    tts_result = speech_service.text_to_speech(
-        text="你好，这是一个测试文本",
-        rate=150,
-        voice=None
-    )
-    print(f"生成的语音文件: {tts_result['audio_path']}")
\ No newline at end of file
+    try:
+        voices_info = speech_service.get_available_voices()
+        print(json.dumps(voices_info, indent=2, ensure_ascii=False))
+        print("\n文本转语音测试:")
+        tts_result = speech_service.text_to_speech(
+            text="你好，这是一个测试文本",
+            rate=150,
+            voice=None
+        )
+        print(f"生成的语音文件: {tts_result['audio_path']}")
+    finally:
+        speech_service.close()
\ No newline at end of file
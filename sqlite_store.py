@@ -0,0 +1,100 @@
+#coding=utf-8
+"""后台批量写入的SQLite存储基类
+
+调用方登记的记录进入队列后立即返回，由一个后台线程攒成批(最多batch_size条，
+或等待flush_interval秒)在同一个事务中提交，调用方不会被磁盘IO阻塞。
+数据库使用WAL模式，读取可以与写入线程同时进行。进程退出时(atexit)自动写完队列中的记录。
+transcript_store.TranscriptStore 和 chat_history.ChatHistoryStore 共用这套写入逻辑。
+"""
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from typing import Any, List
+
+
+class BatchedSQLiteStore:
+    """子类提供SCHEMA并实现_write_batch(conn, batch)，通过_submit()登记记录"""
+
+    SCHEMA = ""
+    # 用于错误提示和日志，如"识别结果"
+    STORE_NAME = "记录"
+    THREAD_NAME = "sqlite-writer"
+    LOGGER_NAME = "sqlite_store"
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval: float = 0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(self.LOGGER_NAME)
+        self.pending = queue.Queue()
+        self.closed = False
+        conn = self._connect()
+        try:
+            conn.executescript(self.SCHEMA)
+        finally:
+            conn.close()
+        self.writer = threading.Thread(target=self._write_loop, name=self.THREAD_NAME, daemon=True)
+        self.writer.start()
+        # 写入线程是守护线程，退出前必须等它写完，否则最后一批记录会丢失
+        atexit.register(self.close)
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _submit(self, item: Any):
+        """登记一条待写入的记录，立即返回"""
+        if self.closed:
+            raise RuntimeError(f"{self.STORE_NAME}库已关闭")
+        self.pending.put(item)
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Any]):
+        """在写入线程的事务中写入一批记录"""
+        raise NotImplementedError
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    self.pending.task_done()
+                    break
+                batch = [item]
+                deadline = time.time() + self.flush_interval
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self.pending.get(timeout=max(0.0, deadline - time.time()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                try:
+                    with conn:
+                        self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    self.logger.error(f"写入{self.STORE_NAME}失败: {e}")
+                for _ in range(len(batch) + stop):
+                    self.pending.task_done()
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def flush(self):
+        """等待已提交的记录全部写入"""
+        self.pending.join()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pending.put(None)
+            self.writer.join()
@@ -1,102 +1,474 @@
 import paramiko
+import select
+import threading
+import queue
 import time
 import sys
+import os
+from contextlib import contextmanager
+
+from llama_stream import LlamaStreamParser
+from response_cache import ResponseCache
 
 # 全局变量
 ssh_client = None
-channel = None
+session_pool = None
+bridge_client = None
+# 可选的回复缓存，由connect_to_server根据参数或环境变量LLAMA_RESPONSE_CACHE启用
+response_cache = None
+# 最近一次对话的耗时统计(首字延迟等)
+last_response_stats = {}
 
-def connect_to_server():
-    global ssh_client, channel
-    
-    # 服务器的地址和用户名
-    server_ip = "10.13.0.9"
-    server_username = "wys"
-    server_password = "Nwpuwys."
+# 接收缓冲区和SSH窗口大小，避免大段输出被流控拖慢
+RECV_BUFFER_SIZE = 32768
+CHANNEL_WINDOW_SIZE = 4 * 1024 * 1024
+CHANNEL_MAX_PACKET_SIZE = 64 * 1024
 
-    # 初始化SSH客户端
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+LLAMA_COMMAND = os.environ.get(
+    "LLAMA_COMMAND", "cd /data/wys/InferLLM/build && ./llama -m chinese-alpaca-7b-q4.bin -g GPU"
+)
+# 同时运行的llama会话数量，每个会话都会在远端加载一份模型
+DEFAULT_POOL_SIZE = int(os.environ.get("LLAMA_POOL_SIZE", "1"))
+
+# 单次回复的总时长上限、相邻两次输出之间的最长等待(秒)和最大字符数(0表示不限制)
+DEFAULT_RESPONSE_DEADLINE = float(os.environ.get("LLAMA_RESPONSE_DEADLINE", "300"))
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get("LLAMA_IDLE_TIMEOUT", "60"))
+DEFAULT_MAX_OUTPUT_CHARS = int(os.environ.get("LLAMA_MAX_OUTPUT_CHARS", "0"))
+# 中断生成后等待提示符重新出现的时间
+RESYNC_TIMEOUT = 10
+INTERRUPT = "\x03"
+
+
+class CancelToken:
+    """用于取消一次进行中的对话，cancel()可以在任意线程调用"""
+
+    def __init__(self):
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.callback = None
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            callback = self.callback
+        if callback:
+            callback()
+
+    def attach(self, callback):
+        """登记取消时执行的动作(如向远端发送Ctrl-C)，已取消则立即执行"""
+        with self.lock:
+            self.callback = callback
+            cancelled = self.cancelled
+        if cancelled:
+            callback()
+
+    def detach(self):
+        with self.lock:
+            self.callback = None
 
-    try:
-        # 连接到服务器
-        ssh_client.connect(server_ip, username=server_username, password=server_password)
-        print("成功连接到服务器")
-        
-        # 打开一个交互式shell通道
-        channel = ssh_client.invoke_shell()
-        print("打开交互式shell通道")
 
-        cmd = "cd /data/wys/InferLLM/build && ./llama -m chinese-alpaca-7b-q4.bin -g GPU"
-        channel.send(cmd + "\n")
+class LlamaSession:
+    """SSH传输上的一个交互式通道，其中运行着一个llama进程"""
+
+    def __init__(self, transport, command=LLAMA_COMMAND, name="llama"):
+        self.transport = transport
+        self.command = command
+        self.name = name
+        self.channel = None
+        self.broken = False
+        self.last_response_stats = {}
+
+    def start(self, startup_timeout=10):
+        # 打开一个交互式shell通道(使用更大的窗口，减少流控等待)
+        self.channel = self.transport.open_session(
+            window_size=CHANNEL_WINDOW_SIZE, max_packet_size=CHANNEL_MAX_PACKET_SIZE
+        )
+        self.channel.get_pty()
+        self.channel.invoke_shell()
+        print(f"[{self.name}] 打开交互式shell通道", file=sys.stderr)
+
+        self.channel.send(self.command + "\n")
 
         # 等待模型启动完成
-        start_time = time.time()
-        while time.time() - start_time < 10:  # 最多等待10秒
-            if channel.recv_ready():
-                output = channel.recv(1024).decode("utf-8", errors="ignore")
-                print(f"服务器初始化输出: {output}")
-                if ">" in output:  # 假设模型启动后以 ">" 提示
+        deadline = time.time() + startup_timeout
+        while time.time() < deadline:
+            if not self.wait_for_output(deadline - time.time()):
+                break
+            output = self.channel.recv(RECV_BUFFER_SIZE).decode("utf-8", errors="ignore")
+            print(f"[{self.name}] 服务器初始化输出: {output}", file=sys.stderr)
+            if ">" in output:  # 假设模型启动后以 ">" 提示
+                break
+        return self
+
+    def wait_for_output(self, timeout=None):
+        """阻塞在select上直到通道有数据可读，超时返回False"""
+        if self.channel.recv_ready():
+            return True
+        readable, _, _ = select.select([self.channel], [], [], timeout)
+        return bool(readable)
+
+    def read_output_bytes(self, timeout=None):
+        """读取通道中已到达的原始字节，超时返回b""，通道关闭或出错返回None"""
+        try:
+            if not self.wait_for_output(timeout):
+                return b""
+            data = self.channel.recv(RECV_BUFFER_SIZE)
+            if not data:
+                print(f"[{self.name}] 通道已关闭", file=sys.stderr)
+                self.broken = True
+                return None
+            return data
+        except Exception as e:
+            print(f"[{self.name}] 读取输出时出错: {e}", file=sys.stderr)
+            self.broken = True
+            return None
+
+    def interrupt(self):
+        """向远端发送Ctrl-C，中断正在进行的生成"""
+        try:
+            self.channel.send(INTERRUPT)
+        except Exception as e:
+            print(f"[{self.name}] 发送中断时出错: {e}", file=sys.stderr)
+            self.broken = True
+
+    def send_message_and_get_response(self, message, deadline=DEFAULT_RESPONSE_DEADLINE,
+                                      idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                                      max_output_chars=DEFAULT_MAX_OUTPUT_CHARS, cancel_token=None):
+        """流式产出回复片段
+
+        deadline: 整个回复的时长上限(秒)；idle_timeout: 两次输出之间的最长等待(秒)；
+        max_output_chars: 回复的最大字符数；cancel_token: 用于从其他线程取消。
+        超限或取消时中断远端生成并等待提示符重新出现，返回None；stats中的stop_reason记录结束原因。
+        """
+        try:
+            self.channel.send(message + "\n")
+        except Exception as e:
+            print(f"[{self.name}] 发送消息时出错: {e}", file=sys.stderr)
+            self.broken = True
+            return None
+        sent_at = time.time()
+        deadline_at = sent_at + deadline if deadline else None
+        stats = self.last_response_stats = {
+            "sent_at": sent_at, "first_token_latency": None, "complete": False, "synced": False,
+        }
+        print(f"[{self.name}] 已发送消息: {message}", file=sys.stderr)
+        response = ""
+        # 超限或取消后不再产出文本，继续读到提示符为止，使通道与远端重新同步
+        stop_reason = None
+        resync_at = None
+        # 增量解析: 跳过回显，跨数据块拼接被切开的中文字符，识别结束提示符
+        parser = LlamaStreamParser()
+        if cancel_token is not None:
+            cancel_token.attach(self.interrupt)
+        try:
+            while not parser.done:
+                if resync_at is not None:
+                    wait = resync_at - time.time()
+                else:
+                    wait = idle_timeout or None
+                    if deadline_at is not None:
+                        remaining = deadline_at - time.time()
+                        wait = remaining if wait is None else min(wait, remaining)
+                data = self.read_output_bytes(max(wait, 0)) if wait is not None else self.read_output_bytes()
+                if stop_reason is None:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        # CancelToken已经发送过Ctrl-C
+                        stop_reason = "cancelled"
+                    elif data == b"":
+                        expired = deadline_at is not None and time.time() >= deadline_at
+                        stop_reason = "deadline" if expired else "idle_timeout"
+                        self.interrupt()
+                    if stop_reason:
+                        resync_at = time.time() + RESYNC_TIMEOUT
+                        if data == b"":
+                            continue
+                elif data == b"":
+                    print(f"[{self.name}] 中断后未能回到提示符", file=sys.stderr)
+                    self.broken = True
+                    break
+                output = parser.finish() if data is None else parser.feed(data)
+                if data is None:
                     break
-            time.sleep(0.1)
+                if stop_reason is not None:
+                    continue
+                if max_output_chars and not parser.done and len(response) + len(output) >= max_output_chars:
+                    output = output[:max_output_chars - len(response)]
+                    stop_reason = "max_output_chars"
+                    resync_at = time.time() + RESYNC_TIMEOUT
+                    self.interrupt()
+                if output:
+                    if stats["first_token_latency"] is None:
+                        stats["first_token_latency"] = time.time() - sent_at
+                    response += output
+                    yield output
+        finally:
+            if cancel_token is not None:
+                cancel_token.detach()
+            if stop_reason is not None:
+                print(f"[{self.name}] 回复被中断({stop_reason})", file=sys.stderr)
+            elif parser.done:
+                stop_reason = "complete"
+            elif self.broken:
+                stop_reason = "closed"
+            else:
+                # 调用方提前退出，先让远端停止生成，剩余输出由会话池在后台丢弃
+                stop_reason = "abandoned"
+                self.interrupt()
+            stats["stop_reason"] = stop_reason
+            stats["complete"] = stop_reason == "complete"
+            stats["synced"] = parser.done and not self.broken
+            stats["total_time"] = time.time() - sent_at
+            stats["chars"] = len(response)
+        # 被中断或通道中途关闭时回复不完整，按出错处理
+        return response if stop_reason == "complete" else None
+
+    def drain(self, timeout=30):
+        """丢弃上一次未读完的回复，直到出现提示符；超时则标记为不可用"""
+        parser = LlamaStreamParser(skip_echo=False)
+        deadline = time.time() + timeout
+        while not parser.done:
+            remaining = deadline - time.time()
+            data = self.read_output_bytes(remaining) if remaining > 0 else b""
+            if data is None or remaining <= 0:
+                self.broken = True
+                return False
+            parser.feed(data)
+        return True
+
+    def close(self):
+        if self.channel is not None:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+
+
+class LlamaSessionPool:
+    """在同一个SSH传输上复用多个llama会话，每个请求租用一个会话，其余请求排队等待"""
+
+    def __init__(self, transport, size=DEFAULT_POOL_SIZE, command=LLAMA_COMMAND, lease_timeout=120):
+        self.transport = transport
+        self.size = size
+        self.command = command
+        self.lease_timeout = lease_timeout
+        self.idle = queue.Queue()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.in_use = 0
+        self.waiting = 0
+        self.leases = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+
+    def start(self, startup_timeout=10):
+        """并行启动所有会话，模型加载时间只付一次"""
+        errors = []
 
-        print("模型已启动，可以开始对话")
+        def _start(index):
+            try:
+                session = LlamaSession(self.transport, self.command, name=f"llama-{index}").start(startup_timeout)
+            except Exception as e:
+                errors.append(e)
+                return
+            with self.lock:
+                self.sessions.append(session)
+            self.idle.put(session)
+
+        threads = [threading.Thread(target=_start, args=(i,), daemon=True) for i in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if not self.sessions:
+            raise RuntimeError(f"无法启动llama会话: {errors[0] if errors else '未知错误'}")
+        self.created_at = time.time()
+        return self
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """租用一个空闲会话，超时抛出TimeoutError"""
+        timeout = self.lease_timeout if timeout is None else timeout
+        requested_at = time.time()
+        with self.lock:
+            self.waiting += 1
+        try:
+            session = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            with self.lock:
+                self.timeouts += 1
+            raise TimeoutError(f"等待空闲的llama会话超时({timeout}秒)")
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        leased_at = time.time()
+        wait = leased_at - requested_at
+        with self.lock:
+            self.in_use += 1
+            self.leases += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            yield session
+        finally:
+            with self.lock:
+                self.in_use -= 1
+                self.busy_time += time.time() - leased_at
+            self._release(session)
+
+    def _release(self, session):
+        if not session.broken and session.last_response_stats.get("synced", True):
+            self.idle.put(session)
+            return
+
+        # 回复没有读完(调用方提前退出)时，在后台丢弃剩余输出后再归还；会话损坏则重建
+        def _recover():
+            if not session.broken and session.drain():
+                self.idle.put(session)
+                return
+            self._replace(session)
+
+        threading.Thread(target=_recover, daemon=True).start()
+
+    def _replace(self, session):
+        session.close()
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+        try:
+            replacement = LlamaSession(self.transport, self.command, name=session.name).start()
+        except Exception as e:
+            print(f"[{session.name}] 重建会话失败: {e}", file=sys.stderr)
+            return
+        with self.lock:
+            self.sessions.append(replacement)
+        self.idle.put(replacement)
+
+    def send_message_and_get_response(self, message, timeout=None, **limits):
+        """租用会话完成一次对话，流式产出回复片段；limits见LlamaSession.send_message_and_get_response"""
+        global last_response_stats
+        with self.lease(timeout) as session:
+            response = yield from session.send_message_and_get_response(message, **limits)
+            last_response_stats = session.last_response_stats
+            return response
+
+    def stats(self):
+        with self.lock:
+            elapsed = max(time.time() - self.created_at, 1e-6)
+            return {
+                "size": len(self.sessions),
+                "in_use": self.in_use,
+                "idle": self.idle.qsize(),
+                "waiting": self.waiting,
+                "leases": self.leases,
+                "timeouts": self.timeouts,
+                "mean_wait": round(self.total_wait / self.leases, 4) if self.leases else 0.0,
+                "max_wait": round(self.max_wait, 4),
+                "total_wait": round(self.total_wait, 4),
+                "busy_time": round(self.busy_time, 4),
+                "utilization": round(self.busy_time / (elapsed * max(len(self.sessions), 1)), 4),
+            }
+
+    def close(self):
+        for session in list(self.sessions):
+            session.close()
+
+
+def create_session_pool(pool_size=None, keepalive=None, host=None, port=None, username=None,
+                        password=None, command=None):
+    """连接服务器并启动llama会话池，返回(ssh_client, session_pool)
+
+    未指定的连接参数读取环境变量 LLAMA_SSH_HOST / LLAMA_SSH_PORT / LLAMA_SSH_USER /
+    LLAMA_SSH_PASSWORD，地址、用户名和密码都必须提供(端口默认22)
+    """
+    # 服务器的地址和用户名
+    server_ip = host or os.environ.get("LLAMA_SSH_HOST")
+    server_port = int(port or os.environ.get("LLAMA_SSH_PORT", "22"))
+    server_username = username or os.environ.get("LLAMA_SSH_USER")
+    server_password = password if password is not None else os.environ.get("LLAMA_SSH_PASSWORD")
+    missing = [name for name, value in (("LLAMA_SSH_HOST", server_ip), ("LLAMA_SSH_USER", server_username),
+                                        ("LLAMA_SSH_PASSWORD", server_password)) if not value]
+    if missing:
+        raise ValueError(f"缺少SSH连接参数，请通过参数或环境变量 {'、'.join(missing)} 指定")
+
+    # 初始化SSH客户端
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    # 连接到服务器
+    client.connect(server_ip, port=server_port, username=server_username, password=server_password)
+    print("成功连接到服务器", file=sys.stderr)
+    if keepalive:
+        client.get_transport().set_keepalive(keepalive)
+
+    # 在同一个SSH传输上打开多个llama会话
+    pool = LlamaSessionPool(client.get_transport(), size=pool_size or DEFAULT_POOL_SIZE,
+                            command=command or LLAMA_COMMAND).start()
+    return client, pool
+
+def enable_response_cache(max_entries=256, ttl=3600.0):
+    """启用回复缓存，相同(归一化后)的提问直接重放缓存的回复"""
+    global response_cache
+    response_cache = ResponseCache(max_entries, ttl)
+    return response_cache
+
+def connect_to_server(pool_size=None, bridge_address=None, cache_size=None):
+    """优先连接本地常驻的llm_bridge(模型已预热)，不可用时直接连接服务器
+
+    cache_size: 回复缓存条数，0表示不缓存，默认读取环境变量LLAMA_RESPONSE_CACHE
+    """
+    global ssh_client, session_pool, bridge_client
+
+    cache_size = cache_size if cache_size is not None else int(os.environ.get("LLAMA_RESPONSE_CACHE", "0"))
+    if cache_size > 0:
+        enable_response_cache(cache_size, float(os.environ.get("LLAMA_RESPONSE_CACHE_TTL", "3600")))
+
+    from llm_bridge import BridgeClient, DEFAULT_BRIDGE_ADDRESS
+    bridge_address = bridge_address if bridge_address is not None else os.environ.get("LLM_BRIDGE", DEFAULT_BRIDGE_ADDRESS)
+    if bridge_address:
+        client = BridgeClient(bridge_address)
+        if client.ping():
+            bridge_client = client
+            print(f"已连接到本地对话桥接服务: {bridge_address}")
+            return True
+
+    try:
+        ssh_client, session_pool = create_session_pool(pool_size)
+        print(f"模型已启动({len(session_pool.sessions)}个会话)，可以开始对话")
         return True
 
     except Exception as e:
         print(f"连接或执行命令时出错: {e}")
         return False
 
-def get_char_from_output():
-    global channel
-    if channel:
+def send_message_and_get_response(message, timeout=None, **limits):
+    """从会话池租用一个会话进行对话，并发请求排队等待，不会在同一个shell中交错
+
+    limits: deadline / idle_timeout / max_output_chars / cancel_token，
+    见LlamaSession.send_message_and_get_response
+    """
+    global last_response_stats
+    if response_cache is not None:
+        # 命中缓存时不会产生新的统计，未命中时由实际对话覆盖
+        last_response_stats = {"sent_at": time.time(), "first_token_latency": None, "cached": True}
+        return (yield from response_cache.stream(message, lambda m: _send_uncached(m, timeout, **limits)))
+    return (yield from _send_uncached(message, timeout, **limits))
+
+def _send_uncached(message, timeout=None, **limits):
+    global last_response_stats
+    if bridge_client:
         try:
-            while not channel.recv_ready():
-                time.sleep(0.1)
-            output = channel.recv(1024).decode("utf-8", errors="ignore")
-            return output
+            response = yield from bridge_client.stream(message, timeout, **limits)
+            last_response_stats = bridge_client.last_response_stats
+            return response
         except Exception as e:
-            print(f"读取输出时出错: {e}")
+            print(f"发送消息或获取响应时出错: {e}")
             return None
-    else:
-        print("通道未初始化")
-        return None
-
-def send_message_and_get_response(message):
-    global channel
-    if channel:
+    elif session_pool:
         try:
-            channel.send(message + "\n")
-            print(f"已发送消息: {message}")
-            response = ""
-            skip_input = True  # Flag to skip echoed input
-            while True:
-                output = get_char_from_output()
-                if output:
-                    if skip_input:
-                        # Skip the echoed input until a newline or other marker
-                        if "\n" in output:
-                            skip_input = False
-                        continue
-                    if "#" in output:
-                        # Stop processing if '#' is encountered
-                        output = output[:output.index("#")]
-                        if output:
-                            response += output
-                            yield output
-                        break
-                    if ">" in output:
-                        # Stop at the prompt, yield remaining output if any
-                        output = output[:output.index(">")]
-                        if output:
-                            response += output
-                            yield output
-                        break
-                    response += output
-                    yield output
-                else:
-                    time.sleep(0.1)
-            return response
+            return (yield from session_pool.send_message_and_get_response(message, timeout, **limits))
         except Exception as e:
             print(f"发送消息或获取响应时出错: {e}")
             return None
@@ -124,6 +496,9 @@ def main():
                     sys.stdout.write(output)
                     sys.stdout.flush()
                 print()
+                ttft = last_response_stats.get("first_token_latency")
+                if ttft is not None:
+                    print(f"[首字延迟 {ttft * 1000:.0f}ms, 总耗时 {last_response_stats['total_time']:.2f}s]")
 
     except KeyboardInterrupt:
         print("\n对话被中断")
@@ -133,4 +508,4 @@ def main():
             print("SSH连接已关闭")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
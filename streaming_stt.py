@@ -0,0 +1,276 @@
+#coding=utf-8
+"""本地流式语音识别
+
+麦克风或注入的PCM数据块写入环形缓冲区，经能量VAD(可选webrtcvad)切分语音段，
+说话过程中周期性地用Whisper识别当前语音段给出中间结果，检测到停顿后给出最终结果。
+全程离线运行，也可以用音频文件代替麦克风进行测试:
+
+    python streaming_stt.py --file test.wav
+"""
+import time
+import queue
+import logging
+import argparse
+import threading
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+
+from audio_io import WHISPER_SAMPLE_RATE, load_audio_file, pcm_to_float32
+
+logger = logging.getLogger("streaming_stt")
+
+
+class RingBuffer:
+    """固定容量的float32环形缓冲区，按绝对样本序号读取"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.total = 0  # 累计写入的样本数
+
+    def append(self, samples: np.ndarray):
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) > self.capacity:
+            # 只保留末尾capacity个样本，被丢弃的前缀仍计入总数，保证绝对序号与写入位置一致
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        start = self.total % self.capacity
+        end = start + len(samples)
+        if end <= self.capacity:
+            self.buffer[start:end] = samples
+        else:
+            split = self.capacity - start
+            self.buffer[start:] = samples[:split]
+            self.buffer[:end - self.capacity] = samples[split:]
+        self.total += len(samples)
+
+    def read(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """读取绝对序号[start, end)的样本，已被覆盖的部分会被截掉"""
+        end = self.total if end is None else min(end, self.total)
+        start = max(start, self.total - self.capacity, 0)
+        if start >= end:
+            return np.zeros(0, dtype=np.float32)
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            return self.buffer[a:b].copy()
+        return np.concatenate((self.buffer[a:], self.buffer[:b - self.capacity]))
+
+
+class EnergyVAD:
+    """基于短时能量和自适应噪声基底的语音活动检测，安装了webrtcvad时优先使用"""
+
+    def __init__(self, sample_rate: int = WHISPER_SAMPLE_RATE, threshold_ratio: float = 3.0,
+                 min_energy: float = 1e-4, aggressiveness: int = 2):
+        self.sample_rate = sample_rate
+        self.threshold_ratio = threshold_ratio
+        self.min_energy = min_energy
+        self.noise_floor = min_energy
+        self.webrtc = None
+        try:
+            import webrtcvad
+            self.webrtc = webrtcvad.Vad(aggressiveness)
+        except ImportError:
+            pass
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        if self.webrtc is not None and len(frame) * 1000 // self.sample_rate in (10, 20, 30):
+            pcm = (np.clip(frame, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+            return self.webrtc.is_speech(pcm, self.sample_rate)
+        energy = float(np.mean(frame * frame))
+        speech = energy > max(self.noise_floor * self.threshold_ratio, self.min_energy)
+        if not speech:
+            # 仅在静音帧上更新噪声基底，避免把语音能量当成噪声
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * max(energy, self.min_energy)
+        return speech
+
+
+class StreamingTranscriber:
+    """把连续的音频数据切分为语音段并增量识别
+
+    callback(text, is_final): 说话过程中以is_final=False回调中间结果，语音段结束时以is_final=True回调最终结果
+    """
+
+    def __init__(self, transcribe: Callable[[np.ndarray], str], callback: Callable[[str, bool], None],
+                 sample_rate: int = WHISPER_SAMPLE_RATE, frame_ms: int = 30,
+                 partial_interval: float = 1.0, min_silence: float = 0.6,
+                 min_speech: float = 0.3, pre_roll: float = 0.3, max_segment: float = 25.0,
+                 vad: Optional[EnergyVAD] = None):
+        self.transcribe = transcribe
+        self.callback = callback
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.partial_samples = int(partial_interval * sample_rate)
+        self.silence_frames = max(1, int(min_silence * 1000 / frame_ms))
+        self.min_speech_samples = int(min_speech * sample_rate)
+        self.pre_roll_samples = int(pre_roll * sample_rate)
+        self.max_segment_samples = int(max_segment * sample_rate)
+        self.vad = vad or EnergyVAD(sample_rate)
+        self.ring = RingBuffer(int((max_segment + pre_roll + 5) * sample_rate))
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.segment_start = None  # 当前语音段的起始样本序号
+        self.silent_run = 0
+        self.last_partial_at = 0
+        self.last_partial_text = ""
+        # 最近一个语音段结束(连续静音开始)的时间，用于统计端到端延迟
+        self.last_speech_end_at = None
+
+    def feed(self, samples: np.ndarray):
+        """输入16kHz单声道float32样本"""
+        samples = np.concatenate((self.pending, np.asarray(samples, dtype=np.float32)))
+        usable = len(samples) - len(samples) % self.frame_size
+        self.pending = samples[usable:]
+        for offset in range(0, usable, self.frame_size):
+            frame = samples[offset:offset + self.frame_size]
+            self.ring.append(frame)
+            self._process_frame(frame)
+        if self.segment_start is not None and self.ring.total - self.last_partial_at >= self.partial_samples:
+            self._emit(final=False)
+
+    def feed_pcm(self, pcm: bytes, sample_width: int = 2, channels: int = 1):
+        """输入原始PCM数据(采样率需与sample_rate一致)"""
+        self.feed(pcm_to_float32(pcm, sample_width, channels))
+
+    def _process_frame(self, frame: np.ndarray):
+        speech = self.vad.is_speech(frame)
+        if self.segment_start is None:
+            if speech:
+                self.segment_start = max(0, self.ring.total - len(frame) - self.pre_roll_samples)
+                self.last_partial_at = self.ring.total
+                self.silent_run = 0
+            return
+        self.silent_run = 0 if speech else self.silent_run + 1
+        if self.silent_run >= self.silence_frames or self.ring.total - self.segment_start >= self.max_segment_samples:
+            self._emit(final=True)
+
+    def _emit(self, final: bool):
+        audio = self.ring.read(self.segment_start)
+        self.last_partial_at = self.ring.total
+        if final:
+            self.last_speech_end_at = time.time() - self.silent_run * self.frame_size / self.sample_rate
+            self.segment_start = None
+            self.silent_run = 0
+            self.last_partial_text = ""
+            if len(audio) < self.min_speech_samples:
+                return
+        elif len(audio) < self.min_speech_samples:
+            return
+        try:
+            text = self.transcribe(audio).strip()
+        except Exception as e:
+            logger.error(f"流式识别错误: {e}")
+            return
+        if not text:
+            return
+        if not final:
+            if text == self.last_partial_text:
+                return
+            self.last_partial_text = text
+        self.callback(text, final)
+
+    def flush(self):
+        """输入结束时把未结束的语音段作为最终结果输出"""
+        if len(self.pending):
+            self.ring.append(self.pending)
+            self.pending = np.zeros(0, dtype=np.float32)
+        if self.segment_start is not None:
+            self._emit(final=True)
+
+    def run(self, chunks: Iterable[np.ndarray], stop_event: Optional[threading.Event] = None):
+        """消费音频块直到输入结束或stop_event被设置
+
+        采集和识别分别在两个线程中进行，识别较慢时会一次性合并所有已到达的数据块，
+        从而跳过过时的中间结果而不会阻塞采集。
+        """
+        chunk_queue = queue.Queue()
+        done = object()
+
+        def _produce():
+            try:
+                for chunk in chunks:
+                    chunk_queue.put(chunk)
+                    if stop_event is not None and stop_event.is_set():
+                        break
+            finally:
+                chunk_queue.put(done)
+
+        threading.Thread(target=_produce, name="stt-capture", daemon=True).start()
+        finished = False
+        while not finished and not (stop_event is not None and stop_event.is_set()):
+            try:
+                batch = [chunk_queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(chunk_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is done:
+                finished = True
+                batch.pop()
+            if batch:
+                self.feed(np.concatenate(batch))
+        self.flush()
+
+
+def microphone_chunks(stop_event: threading.Event, sample_rate: int = WHISPER_SAMPLE_RATE,
+                      chunk_ms: int = 100) -> Iterator[np.ndarray]:
+    """从麦克风读取音频块"""
+    import speech_recognition as sr
+    chunk_size = sample_rate * chunk_ms // 1000
+    with sr.Microphone(sample_rate=sample_rate, chunk_size=chunk_size) as source:
+        while not stop_event.is_set():
+            pcm = source.stream.read(chunk_size)
+            yield pcm_to_float32(pcm, source.SAMPLE_WIDTH)
+
+
+def file_chunks(path: str, chunk_ms: int = 100, realtime: bool = False) -> Iterator[np.ndarray]:
+    """把音频文件切成数据块，用于代替麦克风测试；realtime=True时按实际时长节奏输出"""
+    audio = load_audio_file(path)
+    chunk_size = WHISPER_SAMPLE_RATE * chunk_ms // 1000
+    for offset in range(0, len(audio), chunk_size):
+        yield audio[offset:offset + chunk_size]
+        if realtime:
+            time.sleep(chunk_ms / 1000)
+
+
+def whisper_transcriber(model, language: str = 'zh',
+                        lock: Optional[threading.Lock] = None) -> Callable[[np.ndarray], str]:
+    """把Whisper模型包装为StreamingTranscriber使用的识别函数，lock用于和其他调用方互斥使用模型"""
+    lock = lock or threading.Lock()
+
+    def _transcribe(audio: np.ndarray) -> str:
+        with lock:
+            result = model.transcribe(audio, language=language, temperature=0.0,
+                                      condition_on_previous_text=False)
+        return result["text"]
+    return _transcribe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地流式语音识别')
+    parser.add_argument('--file', type=str, default='',
+                        help='用音频文件代替麦克风输入')
+    parser.add_argument('--realtime', action='store_true',
+                        help='按音频实际时长节奏输入文件数据')
+    parser.add_argument('--model', type=str, default='small',
+                        help='Whisper模型大小 (默认: small)')
+    args = parser.parse_args()
+
+    from speech_service import load_shared_whisper_model
+
+    def print_result(text, is_final):
+        print(f"{'[最终]' if is_final else '[中间]'} {text}", flush=True)
+
+    transcriber = StreamingTranscriber(whisper_transcriber(load_shared_whisper_model(args.model)), print_result)
+    stop = threading.Event()
+    try:
+        if args.file:
+            transcriber.run(file_chunks(args.file, realtime=args.realtime), stop)
+        else:
+            print("正在监听... 按Ctrl+C结束")
+            transcriber.run(microphone_chunks(stop), stop)
+    except KeyboardInterrupt:
+        stop.set()
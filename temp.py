@@ -337,4 +337,6 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = ChatGUI()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    exit_code = app.exec_()
+    window.speech_service.close()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,85 @@
+#coding=utf-8
+"""语音识别结果存储
+
+所有识别结果写入同一个SQLite数据库(替代每句话一个stt_<时间戳>.json文件)，
+写入由后台线程批量提交(见sqlite_store)，调用方不会被磁盘IO阻塞；支持按时间范围查询。
+"""
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlite_store import BatchedSQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    text TEXT NOT NULL,
+    duration REAL,
+    latency REAL,
+    source TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_created_at ON transcripts (created_at);
+"""
+
+
+class TranscriptStore(BatchedSQLiteStore):
+    """追加写入的识别结果库，写入在后台线程中批量提交"""
+
+    SCHEMA = SCHEMA
+    STORE_NAME = "识别结果"
+    THREAD_NAME = "transcript-writer"
+    LOGGER_NAME = "transcript_store"
+
+    def append(self, text: str, duration: Optional[float] = None, latency: Optional[float] = None,
+               created_at: Optional[float] = None, source: Optional[str] = None, **extra):
+        """登记一条识别结果，立即返回"""
+        self._submit((
+            created_at if created_at is not None else time.time(),
+            text,
+            duration,
+            latency,
+            source,
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        ))
+
+    def _write_batch(self, conn, batch):
+        conn.executemany(
+            "INSERT INTO transcripts (created_at, text, duration, latency, source, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按时间范围[start, end)查询识别结果，按时间升序返回"""
+        sql = "SELECT id, created_at, text, duration, latency, source, extra FROM transcripts WHERE 1=1"
+        params: List[Any] = []
+        if start is not None:
+            sql += " AND created_at >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND created_at < ?"
+            params.append(end)
+        sql += " ORDER BY created_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        results = []
+        for row_id, created_at, text, duration, latency, source, extra in rows:
+            record = {
+                "id": row_id,
+                "created_at": created_at,
+                "text": text,
+                "duration": duration,
+                "latency": latency,
+                "source": source,
+            }
+            if extra:
+                record.update(json.loads(extra))
+            results.append(record)
+        return results
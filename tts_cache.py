@@ -0,0 +1,177 @@
+#coding=utf-8
+"""按内容寻址的TTS音频缓存
+
+以(文本, 语速, 音色)的哈希作为文件名保存合成结果，命中时直接返回已有文件；
+总大小超过上限时按最近最少使用(LRU)顺序删除旧文件。
+索引的修改先只记在内存中，由定时器在flush_interval秒后合并写入一次(或在flush()/close()时写入)，
+逐句合成时不会每句都重写整个索引文件。
+"""
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+INDEX_FILENAME = "tts_cache_index.json"
+
+
+def cache_key(text: str, rate: Any, voice: Any) -> str:
+    payload = json.dumps([text, rate, voice], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """TTS音频文件的LRU缓存，索引持久化在缓存目录中"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 200 * 1024 * 1024, extension: str = ".mp3",
+                 flush_interval: float = 2.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self.flush_timer: Optional[threading.Timer] = None
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.flush)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("last_used", 0)):
+            if os.path.exists(self.path_for(key)):
+                self.entries[key] = entry
+                self.total_bytes += entry.get("size", 0)
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _mark_dirty(self):
+        """标记索引需要保存，flush_interval秒内的多次修改合并为一次写入"""
+        self.dirty = True
+        if self.flush_timer is None:
+            self.flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self):
+        """立即写入尚未保存的索引修改"""
+        with self.lock:
+            self.flush_timer = None
+            if self.dirty:
+                self.dirty = False
+                self._save_index()
+
+    def close(self):
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+        self.flush()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"tts_{key[:32]}{self.extension}")
+
+    def get(self, text: str, rate: Any, voice: Any) -> Optional[str]:
+        """命中时返回缓存文件路径并标记为最近使用，未命中返回None"""
+        key = cache_key(text, rate, voice)
+        with self.lock:
+            entry = self.entries.get(key)
+            path = self.path_for(key)
+            if entry is None or not os.path.exists(path):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def put(self, text: str, rate: Any, voice: Any) -> str:
+        """登记一个已经写入path_for(key)的合成结果，返回文件路径"""
+        key = cache_key(text, rate, voice)
+        path = self.path_for(key)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key, delete_file=False)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self.entries[key] = {
+                "text": text,
+                "rate": rate,
+                "voice": voice,
+                "size": size,
+                "last_used": time.time(),
+            }
+            self.total_bytes += size
+            self._evict(keep=key)
+            self._mark_dirty()
+        return path
+
+    def get_or_create(self, text: str, rate: Any, voice: Any, synthesize: Callable[[str], None]) -> str:
+        """命中时直接返回缓存文件，否则调用synthesize(path)生成后登记"""
+        path = self.get(text, rate, voice)
+        if path is not None:
+            return path
+        path = self.path_for(cache_key(text, rate, voice))
+        synthesize(path)
+        return self.put(text, rate, voice)
+
+    def prewarm(self, phrases: Iterable[str], rate: Any, voice: Any,
+                synthesize_many: Callable[[Dict[str, str]], None]) -> int:
+        """预先合成常用短语，synthesize_many接收{文本: 目标路径}，返回新合成的数量"""
+        missing = {}
+        for text in phrases:
+            text = text.strip()
+            if text and text not in missing and self.get(text, rate, voice) is None:
+                missing[text] = self.path_for(cache_key(text, rate, voice))
+        if missing:
+            synthesize_many(missing)
+            with self.lock:
+                for text in missing:
+                    self.put(text, rate, voice)
+        return len(missing)
+
+    def _evict(self, keep: Optional[str] = None):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            self._remove(key)
+
+    def _remove(self, key: str, delete_file: bool = True):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        if delete_file:
+            try:
+                os.unlink(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,319 @@
+#coding=utf-8
+"""TTS工作线程
+
+pyttsx3引擎不是线程安全的，这里由一个专用线程独占引擎，所有合成请求通过队列提交。
+长文本按句切分：合成线程逐句写出音频文件，播放线程同时播放已合成的句子，
+第一句开始播放时后面的句子仍在合成。提交后立即返回TTSHandle，调用方不会被阻塞。
+流式生成的回复用SentenceStreamer边接收边按句提交，不必等整段回复生成完。
+"""
+import os
+import re
+import sys
+import time
+import queue
+import shutil
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from tts_cache import cache_key
+
+logger = logging.getLogger("tts_worker")
+
+SENTENCE_END = re.compile(r'(?<=[。！？!?；;…\n])|(?<=[.])(?=\s)')
+
+
+def split_sentences(text: str, min_chars: int = 4) -> List[str]:
+    """按中英文句末标点切分文本，过短的片段并入前一句"""
+    sentences = []
+    for piece in SENTENCE_END.split(text):
+        if not piece.strip():
+            continue
+        if sentences and len(piece.strip()) < min_chars:
+            sentences[-1] += piece
+        else:
+            sentences.append(piece)
+    return [sentence.strip() for sentence in sentences]
+
+
+def _find_player() -> Optional[List[str]]:
+    if sys.platform == "darwin":
+        return ["afplay"]
+    for command in (["paplay"], ["aplay", "-q"], ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"]):
+        if shutil.which(command[0]):
+            return command
+    return None
+
+
+def play_audio_file(path: str) -> bool:
+    """阻塞播放音频文件，没有可用播放器时返回False"""
+    if sys.platform == "win32":
+        import winsound
+        winsound.PlaySound(path, winsound.SND_FILENAME)
+        return True
+    player = _find_player()
+    if player is None:
+        return False
+    subprocess.run(player + [path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return True
+
+
+def apply_tts_settings(engine, rate: Optional[int], voice: Optional[str]):
+    """设置语速和音色，返回(当前语速, 当前音色ID)"""
+    if rate is not None:
+        engine.setProperty('rate', rate)
+
+    if voice is not None:
+        for v in engine.getProperty('voices'):
+            if voice in v.id or voice in v.name:
+                engine.setProperty('voice', v.id)
+                break
+
+    return engine.getProperty('rate'), engine.getProperty('voice')
+
+
+class TTSHandle:
+    """一次合成请求的句柄，future在全部句子播放(或合成)完成后给出结果"""
+
+    def __init__(self, text: str, sentences: List[str]):
+        self.text = text
+        self.sentences = sentences
+        self.future = Future()
+        self.audio_paths: List[str] = []
+        self.created_at = time.time()
+        self.first_audio_at: Optional[float] = None
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """取消尚未播放的句子"""
+        self.cancelled.set()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self.future.result(timeout)
+
+
+class TTSWorker:
+    """独占pyttsx3引擎的合成线程 + 顺序播放线程"""
+
+    def __init__(self, cache, engine_factory: Optional[Callable[[], Any]] = None):
+        self.cache = cache
+        self.engine_factory = engine_factory
+        self.engine = None
+        # 引擎初始化结束(无论成功与否)后置位
+        self.ready = threading.Event()
+        self.jobs = queue.Queue()
+        self.playback = queue.Queue()
+        self.use_player = sys.platform == "win32" or _find_player() is not None
+        self.synth_thread = threading.Thread(target=self._synth_loop, name="tts-synth", daemon=True)
+        self.play_thread = threading.Thread(target=self._play_loop, name="tts-play", daemon=True)
+        self.synth_thread.start()
+        self.play_thread.start()
+
+    def speak(self, text: str, rate: Optional[int] = None, voice: Optional[str] = None,
+              play: bool = True, split: bool = True) -> TTSHandle:
+        """提交合成请求并立即返回句柄"""
+        sentences = split_sentences(text) if split else [text]
+        handle = TTSHandle(text, sentences)
+        self.jobs.put(("speak", handle, (rate, voice, play)))
+        return handle
+
+    def call(self, fn: Callable[[Any], Any]) -> Future:
+        """在引擎线程中执行fn(engine)，用于读取音色列表等需要访问引擎的操作"""
+        future = Future()
+        self.jobs.put(("call", future, fn))
+        return future
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待引擎初始化完成，返回引擎是否可用"""
+        self.ready.wait(timeout)
+        return self.engine is not None
+
+    def stop(self):
+        self.jobs.put(None)
+
+    def _synth_loop(self):
+        try:
+            if self.engine_factory is not None:
+                self.engine = self.engine_factory()
+            else:
+                import pyttsx3
+                self.engine = pyttsx3.init()
+        except Exception as e:
+            logger.error(f"初始化TTS引擎失败: {e}")
+        self.ready.set()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.playback.put(None)
+                self.cache.close()
+                break
+            kind, target, payload = job
+            if kind == "call":
+                try:
+                    if self.engine is None:
+                        raise RuntimeError("TTS引擎未初始化")
+                    target.set_result(payload(self.engine))
+                except Exception as e:
+                    target.set_exception(e)
+                continue
+            try:
+                self._synthesize(target, *payload)
+            except Exception as e:
+                logger.error(f"文本转语音错误: {e}")
+                if not target.future.done():
+                    target.future.set_exception(e)
+
+    def _synthesize(self, handle: TTSHandle, rate: Optional[int], voice: Optional[str], play: bool):
+        if self.engine is None:
+            raise RuntimeError("TTS引擎未初始化")
+        current_rate, current_voice = apply_tts_settings(self.engine, rate, voice)
+        voice_name = "默认"
+        for v in self.engine.getProperty('voices'):
+            if v.id == current_voice:
+                voice_name = v.name
+                break
+
+        cached = True
+        for sentence in handle.sentences:
+            if handle.cancelled.is_set():
+                break
+            path = self.cache.get(sentence, current_rate, current_voice)
+            if path is None:
+                cached = False
+                self.engine.save_to_file(sentence, self.cache.path_for(cache_key(sentence, current_rate, current_voice)))
+                self.engine.runAndWait()
+                path = self.cache.put(sentence, current_rate, current_voice)
+            handle.audio_paths.append(path)
+            if play and not self.use_player:
+                # 没有外部播放器时只能由引擎朗读，仍按句进行以尽早出声
+                if handle.first_audio_at is None:
+                    handle.first_audio_at = time.time()
+                    handle.started.set()
+                self.engine.say(sentence)
+                self.engine.runAndWait()
+            elif play:
+                self.playback.put((handle, path))
+
+        result = {
+            "success": True,
+            "message": "文本已转换为语音并播放" if play else "文本已转换为语音",
+            "audio_file": os.path.basename(handle.audio_paths[0]) if handle.audio_paths else None,
+            "audio_path": handle.audio_paths[0] if handle.audio_paths else None,
+            "audio_paths": list(handle.audio_paths),
+            "sentences": len(handle.sentences),
+            "cached": cached,
+            "cancelled": handle.cancelled.is_set(),
+            "rate": current_rate,
+            "voice": voice_name,
+        }
+        if play and self.use_player:
+            # 由播放线程在最后一句播放完后给出结果
+            self.playback.put((handle, result))
+        else:
+            self._finish(handle, result)
+
+    def _play_loop(self):
+        while True:
+            item = self.playback.get()
+            if item is None:
+                break
+            handle, payload = item
+            if isinstance(payload, dict):
+                self._finish(handle, payload)
+                continue
+            if handle.cancelled.is_set():
+                continue
+            if handle.first_audio_at is None:
+                handle.first_audio_at = time.time()
+                handle.started.set()
+            try:
+                play_audio_file(payload)
+            except Exception as e:
+                logger.warning(f"播放音频失败: {e}")
+
+    @staticmethod
+    def _finish(handle: TTSHandle, result: Dict[str, Any]):
+        if handle.first_audio_at is not None:
+            result["first_audio_latency"] = round(handle.first_audio_at - handle.created_at, 3)
+        result["total_latency"] = round(time.time() - handle.created_at, 3)
+        if not handle.future.done():
+            handle.future.set_result(result)
+
+
+class SentenceStreamer:
+    """接收流式到达的回复文本，每凑满一句就提交给TTSWorker合成播放
+
+    首句出声的延迟约为生成一句话的时间，而不是整段回复的生成时间。
+    各句按提交顺序进入同一个合成队列和播放队列，播放顺序与文本顺序一致。
+    """
+
+    def __init__(self, worker: TTSWorker, rate: Optional[int] = None, voice: Optional[str] = None,
+                 min_chars: int = 4):
+        self.worker = worker
+        self.rate = rate
+        self.voice = voice
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.handles: List[TTSHandle] = []
+        self.created_at = time.time()
+        self.cancelled = False
+
+    def feed(self, text: str) -> int:
+        """追加一段文本，返回本次提交朗读的句数"""
+        if self.cancelled:
+            return 0
+        self.buffer += text
+        pieces = SENTENCE_END.split(self.buffer)
+        # 最后一段可能还没说完，留在缓冲区；过短的句子与下一句合并
+        pending = ""
+        count = 0
+        for piece in pieces[:-1]:
+            pending += piece
+            if len(pending.strip()) >= self.min_chars:
+                self._speak(pending)
+                pending = ""
+                count += 1
+        self.buffer = pending + pieces[-1]
+        return count
+
+    def close(self) -> List[TTSHandle]:
+        """回复结束，朗读缓冲区中剩余的文本"""
+        if not self.cancelled and self.buffer.strip():
+            self._speak(self.buffer)
+        self.buffer = ""
+        return self.handles
+
+    def cancel(self):
+        """停止朗读尚未播放的句子"""
+        self.cancelled = True
+        self.buffer = ""
+        for handle in self.handles:
+            handle.cancel()
+
+    def _speak(self, sentence: str):
+        self.handles.append(self.worker.speak(sentence.strip(), self.rate, self.voice, split=False))
+
+    @property
+    def first_audio_at(self) -> Optional[float]:
+        return self.handles[0].first_audio_at if self.handles else None
+
+    def wait_first_audio(self, timeout: Optional[float] = None) -> Optional[float]:
+        """等待第一句开始播放，返回开始时间；没有句子、合成失败或超时返回None"""
+        if not self.handles:
+            return None
+        handle = self.handles[0]
+        deadline = None if timeout is None else time.time() + timeout
+        while not handle.started.wait(0.05):
+            if handle.done() or self.cancelled or (deadline is not None and time.time() > deadline):
+                break
+        return handle.first_audio_at
+
+    def wait(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """等待所有句子播放完，返回各句的合成结果"""
+        return [handle.result(timeout) for handle in self.handles]
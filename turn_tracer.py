@@ -0,0 +1,123 @@
+#coding=utf-8
+"""语音对话轮次的端到端延迟追踪
+
+每一轮对话分配一个id，记录各环节的时间点:
+    speech_end   说话结束(VAD/静音判定的语音段结尾)
+    stt_result   识别结果返回
+    request_sent 发送给对话模型
+    first_token  收到第一个回复片段
+    last_token   回复结束
+    first_paint  第一个回复片段显示到界面上
+    first_audio  第一句回复开始播放(开启朗读时)
+一轮结束时计算相邻环节的耗时，写入追踪日志(JSONL，后台线程写入)，
+并维护最近若干轮的滚动分位数，供界面上的调试浮层显示。
+"""
+import json
+import time
+import queue
+import threading
+import itertools
+from collections import deque
+from typing import Any, Dict, Optional
+
+# (名称, 起点事件, 终点事件)
+SPANS = (
+    ("stt", "speech_end", "stt_result"),
+    ("dispatch", "stt_result", "request_sent"),
+    ("first_token", "request_sent", "first_token"),
+    ("generation", "first_token", "last_token"),
+    ("render", "first_token", "first_paint"),
+    ("request_to_paint", "request_sent", "first_paint"),
+    ("speech_to_paint", "speech_end", "first_paint"),
+    ("request_to_audio", "request_sent", "first_audio"),
+    ("speech_to_audio", "speech_end", "first_audio"),
+)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class TurnTracer:
+    """线程安全的轮次追踪器，mark()可以在识别线程、对话线程和GUI线程中调用"""
+
+    def __init__(self, log_path: Optional[str] = None, window: int = 200):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.turns: Dict[int, Dict[str, Any]] = {}
+        self.window = window
+        self.samples = {name: deque(maxlen=window) for name, _, _ in SPANS}
+        self.finished = 0
+        self.log_path = log_path
+        self.log_queue = queue.Queue()
+        if log_path:
+            threading.Thread(target=self._write_loop, name="turn-trace-writer", daemon=True).start()
+
+    def start_turn(self, source: str = "voice", **events: float) -> int:
+        """开始一轮对话，events为已知的时间点(如speech_end/stt_result)"""
+        turn_id = next(self.ids)
+        with self.lock:
+            self.turns[turn_id] = {"turn_id": turn_id, "source": source, "events": dict(events)}
+        return turn_id
+
+    def mark(self, turn_id: Optional[int], event: str, at: Optional[float] = None):
+        """记录时间点，同一事件只记录第一次"""
+        if turn_id is None:
+            return
+        with self.lock:
+            turn = self.turns.get(turn_id)
+            if turn is not None:
+                turn["events"].setdefault(event, at if at is not None else time.time())
+
+    def finish(self, turn_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """结束一轮，计算各环节耗时(毫秒)并写入日志"""
+        if turn_id is None:
+            return None
+        with self.lock:
+            turn = self.turns.pop(turn_id, None)
+            if turn is None:
+                return None
+            events = turn["events"]
+            spans = {}
+            for name, start, end in SPANS:
+                if start in events and end in events:
+                    spans[name] = round((events[end] - events[start]) * 1000, 1)
+                    self.samples[name].append(spans[name])
+            self.finished += 1
+        turn["spans"] = spans
+        if self.log_path:
+            self.log_queue.put(turn)
+        return turn
+
+    def percentiles(self, quantiles=(50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """各环节最近window轮耗时的分位数(毫秒)"""
+        with self.lock:
+            snapshot = {name: list(values) for name, values in self.samples.items() if values}
+        return {
+            name: dict({"n": len(values)}, **{f"p{q}": percentile(values, q) for q in quantiles})
+            for name, values in snapshot.items()
+        }
+
+    def format_summary(self) -> str:
+        """调试浮层显示的文本"""
+        lines = [f"最近{min(self.finished, self.window)}轮 (ms)   p50    p90    p99"]
+        for name, stats in self.percentiles().items():
+            lines.append(f"{name:<18}{stats['p50']:>7.0f}{stats['p90']:>7.0f}{stats['p99']:>7.0f}  n={stats['n']}")
+        return "\n".join(lines)
+
+    def _write_loop(self):
+        while True:
+            turn = self.log_queue.get()
+            if turn is None:
+                break
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"写入追踪日志失败: {e}")
+
+    def close(self):
+        if self.log_path:
+            self.log_queue.put(None)
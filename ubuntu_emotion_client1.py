@@ -8,7 +8,7 @@ import face_recognition
 import time
 import tensorflow as tf
 import argparse
-import urllib.request
+from mjpeg_stream import MJPEGStreamReader
 
 # 不再配置GPU动态内存分配，直接使用CPU
 
@@ -75,41 +75,6 @@ class EmotionRecognizer:
         duration = time.time() - self.current_emotion_start
         print(f"事件触发: {emotion_cn} (持续{duration:.1f}秒)")
 
-class MJPEGStreamReader:
-    def __init__(self, url):
-        self.url = url
-        self.stream = None
-        self.bytes = b''
-        self.connect()
-    def connect(self):
-        try:
-            self.stream = urllib.request.urlopen(self.url)
-            print(f"成功连接到视频流: {self.url}")
-        except Exception as e:
-            print(f"连接视频流失败: {str(e)}")
-            self.stream = None
-    def read_frame(self):
-        if self.stream is None:
-            try:
-                self.connect()
-                if self.stream is None:
-                    return False, None
-            except:
-                return False, None
-        try:
-            while True:
-                self.bytes += self.stream.read(1024)
-                a = self.bytes.find(b'\xff\xd8')
-                b = self.bytes.find(b'\xff\xd9')
-                if a != -1 and b != -1:
-                    jpg = self.bytes[a:b+2]
-                    self.bytes = self.bytes[b+2:]
-                    return True, cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-        except Exception as e:
-            print(f"读取视频帧错误: {str(e)}")
-            self.stream = None
-            return False, None
-
 if __name__ == "__main__":
     recognizer = EmotionRecognizer()
     parser = argparse.ArgumentParser(description='Ubuntu情绪识别客户端-CPU版')
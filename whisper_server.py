@@ -0,0 +1,208 @@
+#coding=utf-8
+"""常驻的本地Whisper模型服务
+
+模型只在服务进程中加载一次，widget.py、temp.py 及其他脚本中的 SpeechService
+通过本地socket共享同一份已预热的模型:
+
+    python whisper_server.py --model small --address 127.0.0.1:50007
+    WHISPER_SERVER=127.0.0.1:50007 python widget.py
+
+连接使用pickle传输对象，必须有认证密钥: 优先读取环境变量 WHISPER_SERVER_AUTHKEY；
+未设置时服务端生成随机密钥写入仅当前用户可读(0600)的密钥文件(默认 ~/.whisper_server_authkey，
+可用 WHISPER_SERVER_AUTHKEY_FILE 修改)，同一用户下的客户端从该文件读取。
+监听非本机回环地址时必须通过环境变量显式指定密钥。
+"""
+import os
+import time
+import secrets
+import ipaddress
+import logging
+import argparse
+import threading
+from multiprocessing.connection import Listener, Client
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_ADDRESS = "127.0.0.1:50007"
+AUTHKEY_ENV = "WHISPER_SERVER_AUTHKEY"
+AUTHKEY_FILE = os.environ.get("WHISPER_SERVER_AUTHKEY_FILE",
+                              os.path.join(os.path.expanduser("~"), ".whisper_server_authkey"))
+
+logger = logging.getLogger("whisper_server")
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """把 host:port 字符串解析为 (host, port)"""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_authkey(path: str = AUTHKEY_FILE) -> bytes:
+    """服务端: 使用环境变量中的密钥，未设置时生成随机密钥写入0600权限的密钥文件"""
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key.encode("utf-8")
+    key = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    # 文件已存在时os.open不会修改权限
+    os.chmod(path, 0o600)
+    return key.encode("utf-8")
+
+
+def load_authkey(path: str = AUTHKEY_FILE) -> bytes:
+    """客户端: 读取环境变量或服务端写出的密钥文件"""
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key.encode("utf-8")
+    try:
+        with open(path, encoding="utf-8") as f:
+            key = f.read().strip()
+    except OSError as e:
+        raise RuntimeError(f"找不到Whisper模型服务密钥({path})，请先启动whisper_server.py或设置{AUTHKEY_ENV}: {e}")
+    if not key:
+        raise RuntimeError(f"Whisper模型服务密钥文件为空: {path}")
+    return key.encode("utf-8")
+
+
+class WhisperServer:
+    """持有一份Whisper模型，为多个客户端串行执行识别请求"""
+
+    def __init__(self, model_size: str, address: str = DEFAULT_ADDRESS):
+        self.model_size = model_size
+        self.address = parse_address(address)
+        if not is_loopback(self.address[0]) and not os.environ.get(AUTHKEY_ENV):
+            raise ValueError(f"监听非回环地址{self.address[0]}时必须通过环境变量{AUTHKEY_ENV}指定密钥")
+        self.model = None
+        self.model_lock = None
+        self.started_at = time.time()
+        self.request_count = 0
+        self.clients = 0
+
+    def load(self):
+        from speech_service import get_whisper_inference_lock, load_shared_whisper_model
+        self.model = load_shared_whisper_model(self.model_size)
+        self.model_lock = get_whisper_inference_lock(self.model_size)
+
+    def info(self) -> Dict[str, Any]:
+        from speech_service import get_process_rss_mb, get_model_memory_mb
+        return {
+            "model_size": self.model_size,
+            "uptime": round(time.time() - self.started_at, 1),
+            "requests": self.request_count,
+            "clients": self.clients,
+            "process_rss_mb": round(get_process_rss_mb(), 1),
+            "model_memory_mb": round(get_model_memory_mb(self.model), 1) if self.model else 0.0,
+        }
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "transcribe":
+            with self.model_lock:
+                self.request_count += 1
+                result = self.model.transcribe(request["audio"], **request.get("kwargs", {}))
+            return {"ok": True, "result": result}
+        if op == "info":
+            return {"ok": True, "result": self.info()}
+        return {"ok": False, "error": f"未知操作: {op}"}
+
+    def serve_client(self, conn):
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    response = self.handle_request(request)
+                except Exception as e:
+                    logger.error(f"处理请求失败: {e}")
+                    response = {"ok": False, "error": str(e)}
+                conn.send(response)
+        finally:
+            self.clients -= 1
+            conn.close()
+
+    def serve_forever(self):
+        authkey = create_authkey()
+        self.load()
+        with Listener(self.address, authkey=authkey) as listener:
+            logger.info(f"Whisper模型服务已启动: {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"接受连接失败: {e}")
+                    continue
+                threading.Thread(target=self.serve_client, args=(conn,), daemon=True).start()
+
+
+class WhisperClient:
+    """Whisper模型服务客户端，提供与whisper模型相同的transcribe接口"""
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: Optional[float] = None):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _request(self, request: Dict[str, Any]) -> Any:
+        with self.lock:
+            if self.conn is None:
+                # 每次建立连接时重新读取密钥，服务重启后会生成新的密钥
+                self.conn = Client(self.address, authkey=load_authkey())
+            try:
+                self.conn.send(request)
+                if self.timeout is not None and not self.conn.poll(self.timeout):
+                    raise TimeoutError("等待Whisper模型服务响应超时")
+                response = self.conn.recv()
+            except Exception:
+                self.close()
+                raise
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Whisper模型服务错误"))
+        return response["result"]
+
+    def transcribe(self, audio, **kwargs) -> Dict[str, Any]:
+        """audio 可以是服务端可访问的文件路径，也可以是16kHz单声道float32的numpy数组"""
+        return self._request({"op": "transcribe", "audio": audio, "kwargs": kwargs})
+
+    def info(self) -> Dict[str, Any]:
+        return self._request({"op": "info"})
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='常驻Whisper模型服务')
+    parser.add_argument('--model', type=str, default=os.environ.get("WHISPER_MODEL_SIZE", "small"),
+                        help='Whisper模型大小 (默认: small)')
+    parser.add_argument('--address', type=str, default=DEFAULT_ADDRESS,
+                        help=f'监听地址 (默认: {DEFAULT_ADDRESS})')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        server = WhisperServer(args.model, args.address)
+    except ValueError as e:
+        parser.error(str(e))
+    server.serve_forever()
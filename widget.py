@@ -1,37 +1,91 @@
+import time
+# 记录进程启动时间，用于统计窗口首次绘制耗时
+APP_START_TIME = time.perf_counter()
+
+import os
 import sys
 import threading
+import itertools
 from ssh import connect_to_server, send_message_and_get_response
-from speech_service import SpeechService
+from chat_view import ChatListView
+from camera_preview import CameraPreview
+from chat_history import ChatHistoryStore, DEFAULT_PAGE_SIZE
+from turn_tracer import TurnTracer
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QApplication,
     QWidget,
     QVBoxLayout,
     QHBoxLayout,
-    QListWidget,
-    QListWidgetItem,
     QLabel,
     QPushButton,
-    QSpacerItem,
     QSizePolicy,
     QLineEdit,
 )
-from PyQt5.QtCore import Qt, QSize, QPropertyAnimation, QEasingCurve, QRect, pyqtSignal
-from PyQt5.QtGui import QIcon, QPainter, QPen, QBrush, QColor, QPixmap
-
-if not connect_to_server():
-    print("无法连接到服务器，程序退出")
-    sys.exit(1)
-
-def count_characters(text):
-    chinese_count = 0
-    english_count = 0
-    for char in text:
-        if "\u4e00" <= char <= "\u9fff" or "\u3000" <= char <= "\u303f" or "\uff00" <= char <= "\uffa0":
-            chinese_count += 1
-        elif char.isalpha() and char.isascii():
-            english_count += 1
-    return chinese_count * 2 + english_count
+from PyQt5.QtCore import Qt, QSize, QPropertyAnimation, QEasingCurve, QRect, QTimer, QObject, pyqtSignal
+from PyQt5.QtGui import QIcon, QPainter, QPen, QBrush, QColor, QPixmap, QFont
+
+# 流式回复先写入缓冲区，由GUI线程的定时器按约30Hz合并刷新到气泡中
+STREAM_FLUSH_INTERVAL_MS = 33
+
+BACKEND_COMPONENTS = {"llm": "对话模型", "tts": "语音合成", "whisper": "语音识别"}
+BACKEND_STATE_TEXT = {"pending": "等待", "loading": "加载中", "ready": "就绪", "failed": "失败"}
+# 设置为1时启动即显示延迟调试浮层(也可以按F12切换)
+DEBUG_OVERLAY = os.environ.get("CHAT_DEBUG_OVERLAY", "0") == "1"
+# 设置为1时默认开启边生成边朗读
+SPEAK_RESPONSES = os.environ.get("CHAT_SPEAK_RESPONSES", "0") == "1"
+# 回复结束后最多等待第一句开始播放的时间(秒)，用于记录first_audio
+FIRST_AUDIO_WAIT = 10
+
+class BackendLoader(QObject):
+    """在后台线程中并行连接对话模型、初始化TTS引擎和加载Whisper模型，窗口不必等待"""
+    stateChanged = pyqtSignal(str, str, float)
+
+    def __init__(self):
+        super().__init__()
+        self.speech_service = None
+        self.speech_lock = threading.Lock()
+        self.states = {name: "pending" for name in BACKEND_COMPONENTS}
+        self.elapsed = {}
+
+    def start(self):
+        targets = {"llm": self._init_llm, "tts": self._init_tts, "whisper": self._init_whisper}
+        for name, target in targets.items():
+            threading.Thread(target=self._run, args=(name, target), name=f"init-{name}", daemon=True).start()
+
+    def is_ready(self, name):
+        return self.states[name] == "ready"
+
+    def _run(self, name, target):
+        started_at = time.perf_counter()
+        self.states[name] = "loading"
+        self.stateChanged.emit(name, "loading", 0.0)
+        try:
+            ok = target()
+        except Exception as e:
+            print(f"初始化{BACKEND_COMPONENTS[name]}失败: {e}")
+            ok = False
+        self.elapsed[name] = time.perf_counter() - started_at
+        self.states[name] = "ready" if ok else "failed"
+        print(f"{BACKEND_COMPONENTS[name]}{BACKEND_STATE_TEXT[self.states[name]]}，耗时 {self.elapsed[name]:.2f}s")
+        self.stateChanged.emit(name, self.states[name], self.elapsed[name])
+
+    def get_speech_service(self):
+        """TTS和Whisper共用一个SpeechService，由先到的线程创建(导入whisper本身也较慢)"""
+        with self.speech_lock:
+            if self.speech_service is None:
+                from speech_service import SpeechService
+                self.speech_service = SpeechService(preload=False)
+            return self.speech_service
+
+    def _init_llm(self):
+        return connect_to_server()
+
+    def _init_tts(self):
+        return self.get_speech_service().tts_worker.wait_ready()
+
+    def _init_whisper(self):
+        return self.get_speech_service().get_whisper_model() is not None
 
 class MicrophoneButton(QPushButton):
     def __init__(self):
@@ -87,15 +141,55 @@ class CameraButton(QPushButton):
         painter.drawEllipse(20, 16, 10, 10)
 
 class ChatGUI(QWidget):
-    addMessageSignal = pyqtSignal(str, bool, int)
+    addMessageSignal = pyqtSignal(str, bool)
+    responseStartedSignal = pyqtSignal(int)
+    responseFinishedSignal = pyqtSignal(int)
+    firstAudioSettledSignal = pyqtSignal(int)
 
     def __init__(self):
         super().__init__()
         self.CHARACTER_IMAGE_PATH = Path(__file__).resolve().parent / "character.png"
-        self.speech_service = SpeechService()
+        self.speech_service = None
         self.stop_event = None
-        self.initUI()
+        self.first_paint_ms = None
+        self.backend = BackendLoader()
+        self.backend.stateChanged.connect(self.on_backend_state_changed)
+
+        # 聊天记录只追加写入，由后台线程提交；打开时只读取最近一页
+        json_files_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "json_files")
+        os.makedirs(json_files_dir, exist_ok=True)
+        self.history = ChatHistoryStore(os.path.join(json_files_dir, "chat_history.db"))
+        self.conversation_id = None
+        self.oldest_message_id = None
+        self.has_older_messages = False
+
+        # 每轮对话的各环节耗时写入追踪日志，分位数显示在调试浮层中
+        self.tracer = TurnTracer(os.path.join(json_files_dir, "turn_traces.jsonl"))
+
+        # 工作线程只往缓冲区追加文本，GUI线程定时合并刷新
+        self.stream_lock = threading.Lock()
+        self.pending_chunks = {}
+        self.stream_messages = {}
+        # 每个回复所属的对话，以及切换对话后不再显示、只待保存的回复 {id: [文本, 创建时间]}
+        self.stream_conversations = {}
+        self.detached_streams = {}
+        self.stream_turns = {}
+        # 每轮对话结束前还要等待的事件数(回复显示完毕，开启朗读时还有第一句开始播放)
+        self.turn_holds = {}
+        # 正在朗读的回复，关闭朗读或开始录音时取消
+        self.speak_responses = SPEAK_RESPONSES
+        self.active_streamers = set()
+        self.response_ids = itertools.count()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(STREAM_FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush_stream_chunks)
+
         self.addMessageSignal.connect(self.add_message)
+        self.responseStartedSignal.connect(self.begin_stream)
+        self.responseFinishedSignal.connect(self.end_stream)
+        self.firstAudioSettledSignal.connect(self.release_turn)
+        self.initUI()
+        self.backend.start()
 
     def initUI(self):
         self.setWindowTitle("聊天界面")
@@ -112,20 +206,9 @@ class ChatGUI(QWidget):
         chat_column.setSpacing(10)
         root_layout.addLayout(chat_column, 1)
 
-        self.chat_list = QListWidget()
-        self.chat_list.setStyleSheet("""
-            QListWidget {
-                background-color: transparent;
-                border: none;
-                padding: 10px;
-            }
-            QListWidget::item {
-                background-color: transparent;
-            }
-        """)
-        self.chat_list.setWordWrap(True)
-        self.chat_list.setSpacing(5)
-        self.chat_list.setVerticalScrollMode(QListWidget.ScrollPerPixel)
+        # 模型/视图实现的聊天记录，只绘制可见的消息
+        self.chat_list = ChatListView()
+        self.chat_list.olderPageRequested.connect(self.load_older_messages)
         self.chat_list.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         chat_column.addWidget(self.chat_list)
 
@@ -151,6 +234,12 @@ class ChatGUI(QWidget):
             }
         """)
 
+        # 后台组件的初始化状态
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: #99AAB5; font-size: 12px;")
+        chat_column.addWidget(self.status_label)
+        self.update_status_label()
+
         input_layout = QHBoxLayout()
         input_layout.addWidget(self.input_box)
         input_layout.addWidget(self.send_button)
@@ -159,6 +248,8 @@ class ChatGUI(QWidget):
         self.send_button.clicked.connect(self.on_send_button_clicked)
 
         self.mic_button = MicrophoneButton()
+        # 语音服务就绪后才能录音
+        self.mic_button.setEnabled(False)
         self.camera_button = CameraButton()
         self.stop_button = QPushButton("■")
         self.stop_button.setFixedSize(50, 50)
@@ -173,18 +264,43 @@ class ChatGUI(QWidget):
         """)
         self.stop_button.setVisible(False)
 
+        # 朗读开关：开启后回复一边生成一边按句朗读
+        self.speak_button = QPushButton("朗读")
+        self.speak_button.setCheckable(True)
+        self.speak_button.setChecked(self.speak_responses)
+        self.speak_button.setEnabled(False)
+        self.speak_button.setFixedSize(60, 50)
+        self.speak_button.setStyleSheet("""
+            QPushButton {
+                background-color: #4F545C;
+                color: white;
+                border-radius: 10px;
+                border: none;
+            }
+            QPushButton:checked {
+                background-color: #7289DA;
+            }
+            QPushButton:disabled {
+                color: #99AAB5;
+            }
+        """)
+        self.speak_button.toggled.connect(self.on_speak_toggled)
+
         # 修改按钮布局，避免按钮重叠
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.mic_button)
         button_layout.addSpacing(20)
         button_layout.addWidget(self.camera_button)
         button_layout.addSpacing(20)
+        button_layout.addWidget(self.speak_button)
+        button_layout.addSpacing(20)
         button_layout.addWidget(self.stop_button)
         button_layout.setAlignment(Qt.AlignLeft | Qt.AlignBottom)
         chat_column.addLayout(button_layout)
 
         self.mic_button.clicked.connect(self.on_mic_button_clicked)
         self.stop_button.clicked.connect(self.on_stop_button_clicked)
+        self.camera_button.clicked.connect(self.on_camera_button_clicked)
 
         self.character_panel = QLabel()
         self.character_panel.setObjectName("characterPanel")
@@ -211,7 +327,69 @@ class ChatGUI(QWidget):
             )
 
         root_layout.addWidget(self.character_panel)
-        self.bootstrap_demo_messages()
+
+        # 摄像头预览与人物面板占用同一位置，点击摄像头按钮切换
+        self.camera_preview = CameraPreview()
+        self.camera_preview.setFixedWidth(280)
+        self.camera_preview.setMinimumHeight(400)
+        self.camera_preview.setVisible(False)
+        root_layout.addWidget(self.camera_preview)
+
+        # 延迟调试浮层，叠加在聊天记录左上角
+        self.debug_overlay = QLabel(self)
+        overlay_font = QFont("monospace")
+        overlay_font.setStyleHint(QFont.Monospace)
+        overlay_font.setPixelSize(11)
+        self.debug_overlay.setFont(overlay_font)
+        self.debug_overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 170); color: #7CFC00; padding: 6px; border-radius: 4px;"
+        )
+        self.debug_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.debug_overlay.move(20, 20)
+        self.debug_overlay.setVisible(DEBUG_OVERLAY)
+        self.update_debug_overlay()
+        self.open_conversation(self.history.latest_conversation())
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_ms is None:
+            self.first_paint_ms = (time.perf_counter() - APP_START_TIME) * 1000
+            print(f"窗口首次绘制耗时: {self.first_paint_ms:.0f}ms")
+            QTimer.singleShot(0, self.update_status_label)
+
+    def on_backend_state_changed(self, name, state, elapsed):
+        if name == "tts":
+            self.speak_button.setEnabled(state == "ready")
+        if state == "ready" and name in ("tts", "whisper") and self.speech_service is None:
+            self.speech_service = self.backend.speech_service
+            if not self.stop_button.isVisible():
+                self.mic_button.setEnabled(True)
+        self.update_status_label()
+
+    def update_status_label(self):
+        parts = []
+        for name, title in BACKEND_COMPONENTS.items():
+            state = self.backend.states[name]
+            text = f"{title}: {BACKEND_STATE_TEXT[state]}"
+            if state in ("ready", "failed"):
+                text += f"({self.backend.elapsed[name]:.1f}s)"
+            parts.append(text)
+        if self.first_paint_ms is not None:
+            parts.append(f"首次绘制 {self.first_paint_ms:.0f}ms")
+        self.status_label.setText("  |  ".join(parts))
+
+    def update_debug_overlay(self):
+        if not self.debug_overlay.isHidden():
+            self.debug_overlay.setText(self.tracer.format_summary())
+            self.debug_overlay.adjustSize()
+            self.debug_overlay.raise_()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_F12:
+            self.debug_overlay.setVisible(self.debug_overlay.isHidden())
+            self.update_debug_overlay()
+            return
+        super().keyPressEvent(event)
 
     def showEvent(self, event):
         super().showEvent(event)
@@ -223,97 +401,129 @@ class ChatGUI(QWidget):
         self.animation.setStartValue(initial_geometry)
         self.animation.setEndValue(initial_geometry.adjusted(2, 2, -2, -2))
 
-    def add_message(self, text, is_ai=True, item_index=None):
-        if item_index is None:
-            # Create new dialog box
-            item = QListWidgetItem()
-            message_widget = QWidget()
-            message_layout = QHBoxLayout()
-            message_layout.setSpacing(8)
-
-            avatar = QLabel("🤖" if is_ai else "😊")
-            avatar.setFixedSize(40, 40)
-            avatar.setStyleSheet("""
-                QLabel {
-                    background-color: #FFFFFF;
-                    color: #000000;
-                    font-size: 24px;
-                    border-radius: 20px;
-                    border: 2px solid #555555;
-                    text-align: center;
-                }
-            """)
-            avatar.setAlignment(Qt.AlignCenter)
-
-            label = QLabel(text)
-            label.setWordWrap(True)
-            sizet = count_characters(text)
-            label.setStyleSheet("""
-                QLabel {
-                    background-color: %s;
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 20px;
-                    font-size: 16px;
-                    min-width: %dpx;
-                }
-            """ % ("#7289DA" if is_ai else "#4CAF50", 360 if sizet >= 42 else sizet * 9))
-            label.setMinimumSize(label.sizeHint())
-            label.setMaximumWidth(600)
-
-            if is_ai:
-                message_layout.addWidget(avatar)
-                message_layout.addWidget(label)
-                message_layout.addSpacerItem(QSpacerItem(0, 0, QSizePolicy.Expanding))
-            else:
-                message_layout.addSpacerItem(QSpacerItem(0, 0, QSizePolicy.Expanding))
-                message_layout.addWidget(label)
-                message_layout.addWidget(avatar)
-
-            message_widget.setLayout(message_layout)
-            item.setSizeHint(message_widget.sizeHint())
-            self.chat_list.addItem(item)
-            self.chat_list.setItemWidget(item, message_widget)
-        else:
-            # Update existing dialog box
-            item = self.chat_list.item(item_index)
-            message_widget = self.chat_list.itemWidget(item)
-            label = message_widget.findChild(QLabel)
-            current_text = label.text()
-            new_text = current_text + " " + text
-            label.setText(new_text)
-            sizet = count_characters(new_text)
-            label.setStyleSheet("""
-                QLabel {
-                    background-color: %s;
-                    color: white;
-                    padding: 8px 12px;
-                    border-radius: 20px;
-                    font-size: 16px;
-                    min-width: %dpx;
-                }
-            """ % ("#7289DA" if is_ai else "#4CAF50", 360 if sizet >= 42 else sizet * 9))
-            label.setMinimumSize(label.sizeHint())
-            item.setSizeHint(message_widget.sizeHint())
-        message_widget.setLayout(message_layout)
-        message_widget.setStyleSheet("background-color: transparent;")
-        item.setSizeHint(message_widget.sizeHint())
-        self.chat_list.addItem(item)
-        self.chat_list.setItemWidget(item, message_widget)
-
-        self.chat_list.scrollToBottom()
-        self.chat_list.update()
+    def add_message(self, text, is_ai=True):
+        return self.chat_list.add_message(text, is_ai)
+
+    def begin_stream(self, response_id):
+        """为一次回复创建一个空气泡，之后的片段都追加到这个气泡中"""
+        with self.stream_lock:
+            conversation_id = self.stream_conversations.setdefault(response_id, self.conversation_id)
+        if conversation_id != self.conversation_id:
+            # 发送后已经切换了对话，回复只保存到原对话中
+            self.detached_streams[response_id] = ["", time.time()]
+            return
+        self.stream_messages[response_id] = self.add_message("", True)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush_stream_chunks(self):
+        with self.stream_lock:
+            pending = {}
+            for response_id, chunks in self.pending_chunks.items():
+                if chunks and (response_id in self.stream_messages or response_id in self.detached_streams):
+                    pending[response_id] = "".join(chunks)
+                    chunks.clear()
+        for response_id, text in pending.items():
+            if response_id in self.detached_streams:
+                self.detached_streams[response_id][0] += text
+                continue
+            message = self.stream_messages[response_id]
+            first_text = not message.text
+            self.chat_list.append_text(message, text)
+            if first_text and response_id in self.stream_turns:
+                # 排到本轮重绘之后再记录，近似第一段文字实际显示出来的时间
+                turn_id = self.stream_turns[response_id]
+                QTimer.singleShot(0, lambda turn_id=turn_id: self.tracer.mark(turn_id, "first_paint"))
+        if pending:
+            self.chat_list.scrollToBottom()
+
+    def end_stream(self, response_id):
+        self.flush_stream_chunks()
+        with self.stream_lock:
+            self.pending_chunks.pop(response_id, None)
+            conversation_id = self.stream_conversations.pop(response_id, self.conversation_id)
+        message = self.stream_messages.pop(response_id, None)
+        detached = self.detached_streams.pop(response_id, None)
+        if message is not None and not message.text:
+            self.chat_list.append_text(message, "(没有收到回复)")
+        elif message is not None:
+            self.history.append_message(conversation_id, message.text, True, message.created_at)
+        elif detached is not None and detached[0]:
+            self.history.append_message(conversation_id, detached[0], True, detached[1])
+        turn_id = self.stream_turns.pop(response_id, None)
+        if turn_id is not None:
+            # 在first_paint之后结束本轮
+            QTimer.singleShot(0, lambda: self.release_turn(turn_id))
+        if not self.stream_messages:
+            self.flush_timer.stop()
+
+    def release_turn(self, turn_id):
+        """回复显示完毕或第一句开始播放(或放弃等待)时调用，都完成后结束本轮"""
+        with self.stream_lock:
+            holds = self.turn_holds.get(turn_id, 1) - 1
+            if holds > 0:
+                self.turn_holds[turn_id] = holds
+                return
+            self.turn_holds.pop(turn_id, None)
+        self.finish_turn(turn_id)
+
+    def wait_first_audio(self, streamer, turn_id):
+        """在单独的线程中等待第一句开始播放，不阻塞回复结束的处理"""
+        first_audio_at = streamer.wait_first_audio(FIRST_AUDIO_WAIT)
+        if first_audio_at is not None:
+            self.tracer.mark(turn_id, "first_audio", first_audio_at)
+        self.firstAudioSettledSignal.emit(turn_id)
+
+    def finish_turn(self, turn_id):
+        turn = self.tracer.finish(turn_id)
+        if turn is not None and turn["spans"]:
+            print("本轮耗时(ms): " + ", ".join(f"{name}={value:.0f}" for name, value in turn["spans"].items()))
+        self.update_debug_overlay()
 
     def on_send_button_clicked(self):
         text = self.input_box.text().strip()
         if text:
-            self.addMessageSignal.emit(text, False, None)
+            turn_id = self.tracer.start_turn("text")
+            self.addMessageSignal.emit(text, False)
+            self.history.append_message(self.conversation_id, text, False)
             self.input_box.clear()
+            if not self.backend.is_ready("llm"):
+                if self.backend.states["llm"] == "failed":
+                    self.addMessageSignal.emit("无法连接到服务器，请检查网络后重启程序", True)
+                else:
+                    self.addMessageSignal.emit("对话模型加载中，请稍后再试", True)
+                self.tracer.finish(turn_id)
+                return
             threading.Thread(
-                target=self.handle_ai_response, args=(text,), daemon=True
+                target=self.handle_ai_response, args=(text, turn_id, self.conversation_id), daemon=True
             ).start()
 
+    def on_speak_toggled(self, checked):
+        self.speak_responses = checked
+        if not checked:
+            self.stop_speaking()
+
+    def start_speaking(self):
+        """开启朗读且TTS就绪时返回一个SentenceStreamer，否则返回None"""
+        if not self.speak_responses or not self.backend.is_ready("tts"):
+            return None
+        streamer = self.backend.speech_service.speak_stream()
+        with self.stream_lock:
+            self.active_streamers = {
+                s for s in self.active_streamers if not all(h.done() for h in s.handles)
+            }
+            self.active_streamers.add(streamer)
+        return streamer
+
+    def stop_speaking(self):
+        with self.stream_lock:
+            streamers, self.active_streamers = self.active_streamers, set()
+        for streamer in streamers:
+            streamer.cancel()
+
     def on_mic_button_clicked(self):
+        # 开始录音时停止朗读，避免麦克风录进回复的声音
+        self.stop_speaking()
         self.mic_button.setEnabled(False)
         self.stop_button.setVisible(True)
         self.animation.start()
@@ -333,25 +543,109 @@ class ChatGUI(QWidget):
             self.stop_event.set()
             self.recognition_thread.join()
 
+    def on_camera_button_clicked(self):
+        if self.camera_preview.isVisible():
+            self.camera_preview.stop()
+            self.camera_preview.setVisible(False)
+            self.character_panel.setVisible(True)
+        else:
+            self.character_panel.setVisible(False)
+            self.camera_preview.setVisible(True)
+            self.camera_preview.start()
+
+    def closeEvent(self, event):
+        self.camera_preview.stop()
+        self.stop_speaking()
+        if self.backend.speech_service is not None:
+            self.backend.speech_service.close()
+        self.history.close()
+        self.tracer.close()
+        super().closeEvent(event)
+
     def on_speech_recognized(self, text):
-        self.addMessageSignal.emit(text, False, None)
+        timing = self.speech_service.last_recognition_timing if self.speech_service else {}
+        turn_id = self.tracer.start_turn("voice", **{event: at for event, at in timing.items() if at})
+        self.addMessageSignal.emit(text, False)
+        self.history.append_message(self.conversation_id, text, False)
         threading.Thread(
-            target=self.handle_ai_response, args=(text,), daemon=True
+            target=self.handle_ai_response, args=(text, turn_id, self.conversation_id), daemon=True
         ).start()
 
-    def handle_ai_response(self, text):
-        response_generator = send_message_and_get_response(text)
-        if response_generator:
-            for output in response_generator:
-                self.addMessageSignal.emit(output, True, None)
-                QApplication.processEvents()  # 确保实时更新 UI
+    def handle_ai_response(self, text, turn_id=None, conversation_id=None):
+        response_id = next(self.response_ids)
+        streamer = self.start_speaking()
+        with self.stream_lock:
+            self.pending_chunks[response_id] = []
+            if conversation_id is not None:
+                # 回复保存到提问时所在的对话
+                self.stream_conversations[response_id] = conversation_id
+            if turn_id is not None:
+                self.stream_turns[response_id] = turn_id
+                self.turn_holds[turn_id] = 2 if streamer is not None else 1
+        self.responseStartedSignal.emit(response_id)
+        try:
+            self.tracer.mark(turn_id, "request_sent")
+            for output in send_message_and_get_response(text):
+                self.tracer.mark(turn_id, "first_token")
+                with self.stream_lock:
+                    self.pending_chunks[response_id].append(output)
+                if streamer is not None:
+                    # 每凑满一句就交给TTS，生成和朗读同时进行
+                    streamer.feed(output)
+            self.tracer.mark(turn_id, "last_token")
+            if streamer is not None:
+                streamer.close()
+        except Exception:
+            if streamer is not None:
+                streamer.cancel()
+            raise
+        finally:
+            # 回复一结束就保存并结束流式显示，朗读在后台继续
+            self.responseFinishedSignal.emit(response_id)
+            if streamer is not None and turn_id is not None:
+                threading.Thread(target=self.wait_first_audio, args=(streamer, turn_id),
+                                 name="first-audio-wait", daemon=True).start()
 
     def new_dialog(self):
+        self.stop_speaking()
+        self.open_conversation(None)
+
+    def open_conversation(self, conversation_id):
+        """打开一个对话(None表示新建)，只加载最近一页消息"""
+        # 进行中的回复不再显示(气泡的行号在新列表中已无效)，只保留文本，结束时存入原对话
+        for response_id, message in self.stream_messages.items():
+            self.detached_streams[response_id] = [message.text, message.created_at]
+        self.stream_messages.clear()
         self.chat_list.clear()
-        self.bootstrap_demo_messages()
+        self.oldest_message_id = None
+        self.has_older_messages = False
+        if conversation_id is None:
+            self.conversation_id = self.history.create_conversation()
+            self.bootstrap_demo_messages()
+            return
+        self.conversation_id = conversation_id
+        page = self.history.load_page(conversation_id, limit=DEFAULT_PAGE_SIZE)
+        if not page:
+            self.bootstrap_demo_messages()
+            return
+        self.chat_list.prepend_messages(page)
+        self.oldest_message_id = page[0]["id"]
+        self.has_older_messages = len(page) == DEFAULT_PAGE_SIZE
+        self.chat_list.scrollToBottom()
+
+    def load_older_messages(self):
+        """滚动到顶部时加载更早的一页"""
+        if not self.has_older_messages:
+            return
+        page = self.history.load_page(self.conversation_id, before_id=self.oldest_message_id,
+                                      limit=DEFAULT_PAGE_SIZE)
+        self.has_older_messages = len(page) == DEFAULT_PAGE_SIZE
+        if page:
+            self.oldest_message_id = page[0]["id"]
+            self.chat_list.prepend_messages(page)
 
     def bootstrap_demo_messages(self):
-        self.addMessageSignal.emit("你好！有什么可以帮助你的吗？", True, None)
+        self.addMessageSignal.emit("你好！有什么可以帮助你的吗？", True)
 
 if __name__ == "__main__":
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)